@@ -1,8 +1,15 @@
 import streamlit as st
+import os
 import time
+import uuid
 from pubmed_api import search_pubmed
 from gemini_ai import MedicalAssistant
 from vector_db import MedicalVectorDB
+from search_client import SearchServiceClient
+from ingest_queue import IngestionWorker
+from subscriptions import SubscriptionStore, SubscriptionSyncer, SubscriptionScheduler
+import tracing
+from tracing import span
 
 # 设置页面配置
 st.set_page_config(
@@ -19,11 +26,44 @@ def load_assistant():
 
 @st.cache_resource
 def load_vector_db():
-    return MedicalVectorDB()
+    # 设置 SEARCH_SERVICE_URL（如 http://127.0.0.1:8800）后使用共享的检索服务，不在本进程加载模型和索引
+    service_url = os.environ.get("SEARCH_SERVICE_URL")
+    if service_url:
+        return SearchServiceClient(service_url)
+    # 设置 NEAR_DUPLICATE_THRESHOLD（如0.95）可在入库时归并近似重复论文
+    threshold = os.environ.get("NEAR_DUPLICATE_THRESHOLD")
+    return MedicalVectorDB(near_duplicate_threshold=float(threshold) if threshold else None)
+
+@st.cache_resource
+def load_ingestion_worker(_vector_db):
+    # 使用检索服务时直接提交到服务端的入库队列，进度和已入库论文数也由服务端统计
+    if isinstance(_vector_db, SearchServiceClient):
+        return _vector_db
+    return IngestionWorker(_vector_db).start()
 
 # 加载组件
 assistant = load_assistant()
 vector_db = load_vector_db()
+ingestion_worker = load_ingestion_worker(vector_db)
+
+@st.cache_resource
+def load_subscriptions(_vector_db):
+    store = SubscriptionStore(_vector_db.data_dir)
+    # 在同步线程中直接入库（不经过后台队列），入库失败时才能回退订阅的高水位
+    syncer = SubscriptionSyncer(store, _vector_db)
+    # SUBSCRIPTION_SYNC_INTERVAL 为定时同步间隔（秒），0表示只手动同步
+    interval = int(os.environ.get("SUBSCRIPTION_SYNC_INTERVAL", "3600"))
+    scheduler = SubscriptionScheduler(syncer, interval=interval)
+    if interval > 0:
+        scheduler.start()
+    return store, syncer, scheduler
+
+subscription_store, subscription_syncer, subscription_scheduler = load_subscriptions(vector_db)
+
+# 每个浏览器会话使用独立的对话历史
+if 'session_id' not in st.session_state:
+    st.session_state.session_id = str(uuid.uuid4())
+session_id = st.session_state.session_id
 
 # 侧边栏
 with st.sidebar:
@@ -34,7 +74,7 @@ with st.sidebar:
     st.subheader("选择模式")
     mode = st.radio(
         "请选择使用模式:",
-        ["论文检索与分析", "医学问答", "患者教育材料生成", "数据库统计"]
+        ["论文检索与分析", "医学问答", "患者教育材料生成", "数据库统计", "检索订阅", "系统诊断"]
     )
     
     # 高级选项
@@ -46,8 +86,21 @@ with st.sidebar:
         
         st.markdown("---")
         if st.button("清除对话历史"):
-            assistant.clear_history()
+            assistant.clear_history(session_id)
             st.success("对话历史已清除")
+        
+        # 入库进度
+        st.markdown("---")
+        st.subheader("入库进度")
+        ingest_status = ingestion_worker.get_status()
+        st.caption(f"队列深度: {ingest_status['queue_depth']}/{ingest_status['queue_capacity']}  |  "
+                   f"待处理论文: {ingest_status['pending_papers']}")
+        if ingest_status['submitted_papers']:
+            st.progress(ingest_status['processed_papers'] / ingest_status['submitted_papers'])
+        if ingest_status['last_error']:
+            st.warning(f"最近一次入库失败: {ingest_status['last_error']}")
+        # 点击按钮会触发页面重新运行，从而刷新进度
+        st.button("刷新进度")
     
     # 数据库管理
     if mode == "数据库统计":
@@ -75,19 +128,33 @@ if mode == "论文检索与分析":
         # 按钮，用于触发搜索
         search_clicked = st.button('搜索PubMed最新研究')
         
+        if query and st.button('订阅此检索'):
+            subscription_store.add(query, days=days_filter or 30)
+            st.success(f"已订阅“{query}”，可在“检索订阅”中查看新论文")
+        
         if search_clicked and query:
             with st.spinner("正在搜索PubMed..."):
                 # 获取PubMed文献详细信息
-                results = search_pubmed(query, max_results=max_results, days=days_filter)
+                with span("app.search_pubmed", max_results=max_results, days=days_filter) as s:
+                    results = search_pubmed(query, max_results=max_results, days=days_filter)
+                    s.set("count", len(results))
                 
-                # 保存到向量数据库
-                if results:
-                    vector_db.add_papers(results)
-                    
-                    st.session_state.current_papers = results
-                    st.success(f"找到 {len(results)} 篇相关论文")
-                else:
-                    st.warning("未找到相关论文，请尝试其他关键词")
+            if results:
+                st.session_state.current_papers = results
+                st.success(f"找到 {len(results)} 篇相关论文")
+                
+                # 交给后台线程生成向量并保存到向量数据库；队列满时不等待，先展示结果，稍后可重试入库
+                st.session_state.pending_ingest = results
+            else:
+                st.warning("未找到相关论文，请尝试其他关键词")
+        
+        if st.session_state.get('pending_ingest'):
+            if ingestion_worker.submit(st.session_state.pending_ingest, timeout=0):
+                st.session_state.pending_ingest = None
+                st.info(f"论文已加入后台入库队列（当前队列深度: {ingestion_worker.queue_depth()}）")
+            else:
+                st.warning("入库队列繁忙，本次结果暂未保存到向量数据库")
+                st.button("重试入库")
     
     # 显示搜索结果
     if 'current_papers' in st.session_state and st.session_state.current_papers:
@@ -109,13 +176,14 @@ if mode == "论文检索与分析":
                     paper = st.session_state.current_papers[idx]
                     
                     with st.spinner("AI正在分析论文..."):
-                        analysis = assistant.parse_pubmed_article(paper)
+                        analysis = assistant.parse_pubmed_article(paper, session_id=session_id)
                         st.session_state.current_analysis = analysis
             
             elif analysis_type == "多篇论文综合分析":
                 if st.button("综合分析所有论文"):
                     with st.spinner("AI正在综合分析多篇论文..."):
-                        analysis = assistant.analyze_multiple_papers(st.session_state.current_papers)
+                        analysis = assistant.analyze_multiple_papers(
+                            st.session_state.current_papers, session_id=session_id)
                         st.session_state.current_analysis = analysis
         
         # 显示论文列表
@@ -165,7 +233,7 @@ elif mode == "医学问答":
         with st.chat_message("assistant"):
             message_placeholder = st.empty()
             
-            with st.spinner("AI思考中..."):
+            with st.spinner("AI思考中..."), span("app.answer_question", use_papers=use_papers) as s:
                 context_papers = []
                 
                 # 如果选择使用相关论文
@@ -178,7 +246,8 @@ elif mode == "医学问答":
                         time.sleep(1)
                 
                 # 生成回答
-                response = assistant.answer_medical_question(prompt, context_papers)
+                s.set("context_papers", len(context_papers))
+                response = assistant.answer_medical_question(prompt, context_papers, session_id=session_id)
                 
                 # 显示回答
                 message_placeholder.markdown(response)
@@ -194,7 +263,7 @@ elif mode == "患者教育材料生成":
     
     if st.button("生成教育材料") and topic:
         with st.spinner("正在生成患者教育材料..."):
-            education_material = assistant.generate_patient_education(topic)
+            education_material = assistant.generate_patient_education(topic, session_id=session_id)
             st.markdown(education_material)
             
             # 提供下载选项
@@ -219,6 +288,8 @@ elif mode == "数据库统计":
         st.metric("期刊数量", stats.get("total_journals", 0))
     with col3:
         st.metric("作者数量", stats.get("total_authors", 0))
+    if stats.get("near_duplicates"):
+        st.caption(f"已归并 {stats['near_duplicates']} 篇近似重复论文")
     
     # 显示期刊分布
     if "top_journals" in stats and stats["top_journals"]:
@@ -248,9 +319,90 @@ elif mode == "数据库统计":
                     st.markdown(f"**期刊:** {result.get('source', 'No journal information')}")
                     st.markdown(f"**发布日期:** {result.get('pub_date', 'Unknown date')}")
                     st.markdown(f"**摘要:** {result.get('abstract', 'No abstract available.')}")
+                    if result.get('duplicates'):
+                        versions = ", ".join(f"{d.get('pmid')} ({d.get('source')})" for d in result['duplicates'])
+                        st.markdown(f"**相似版本:** {versions}")
         else:
             st.warning("未找到相关论文")
 
+# 检索订阅模式
+elif mode == "检索订阅":
+    st.subheader("🔔 检索订阅")
+    
+    subscriptions = subscription_store.list()
+    if not subscriptions:
+        st.info("暂无订阅，可在“论文检索与分析”中搜索后点击“订阅此检索”")
+    else:
+        if st.button("立即同步全部订阅"):
+            with st.spinner("正在同步新论文..."):
+                try:
+                    summary = subscription_syncer.sync_all()
+                    st.success(f"同步完成，共 {sum(summary.values())} 篇新论文已入库")
+                except Exception as e:
+                    st.error(f"同步失败: {e}")
+            subscriptions = subscription_store.list()
+        
+        if subscription_scheduler.last_error:
+            st.warning(f"最近一次定时同步失败: {subscription_scheduler.last_error}")
+        
+        for subscription in subscriptions:
+            with st.expander(subscription["query"]):
+                st.markdown(f"**上次同步:** {subscription['last_sync']}")
+                st.markdown(f"**上次新增:** {subscription['last_new']} 篇  |  **累计新增:** {subscription['total_new']} 篇")
+                if subscription.get("pending_pmids"):
+                    st.markdown(f"**待获取:** {len(subscription['pending_pmids'])} 篇（超出单次上限，下次同步继续）")
+                if subscription.get("retry_pmids") or subscription.get("parked_pmids"):
+                    st.markdown(f"**获取失败:** {len(subscription.get('retry_pmids', {}))} 篇待重试，"
+                                f"{len(subscription.get('parked_pmids', []))} 篇已放弃")
+                if subscription.get("last_error"):
+                    st.warning(f"最近一次同步失败: {subscription['last_error']}")
+                if st.button("取消订阅", key=f"unsubscribe_{subscription['query']}"):
+                    subscription_store.remove(subscription["query"])
+                    st.success("已取消订阅")
+
+# 系统诊断模式
+elif mode == "系统诊断":
+    st.subheader("🩺 系统诊断")
+    
+    enabled = st.checkbox("启用阶段计时追踪", value=tracing.is_enabled())
+    tracing.set_enabled(enabled)
+    
+    # 各阶段滚动延迟统计（基于环形缓冲区中的最近记录）
+    st.subheader("各阶段耗时 (最近记录)")
+    stage_stats = tracing.stage_stats()
+    if stage_stats:
+        st.dataframe(stage_stats, use_container_width=True)
+    else:
+        st.info("暂无追踪数据")
+    
+    # 调度器与入库队列状态
+    col1, col2 = st.columns(2)
+    with col1:
+        st.subheader("LLM调度器")
+        st.json(assistant.scheduler.get_status())
+    with col2:
+        st.subheader("入库队列")
+        st.json(ingestion_worker.get_status())
+    
+    # 最近的span
+    recent_spans = [sp.to_dict() for sp in tracing.get_spans()[-50:]]
+    if recent_spans:
+        st.subheader("最近的追踪记录")
+        st.dataframe(list(reversed(recent_spans)), use_container_width=True)
+    
+    col1, col2 = st.columns(2)
+    with col1:
+        st.download_button(
+            label="导出为JSON Lines",
+            data=tracing.export_jsonl(),
+            file_name="spans.jsonl",
+            mime="application/x-ndjson"
+        )
+    with col2:
+        if st.button("清空追踪记录"):
+            tracing.clear()
+            st.success("追踪记录已清空")
+
 # 页脚
 st.markdown("---")
 st.markdown("© 2025 医学AI助手 | 基于Gemini API和PubMed数据")
@@ -0,0 +1,243 @@
+"""
+批量命令行工具（不依赖Streamlit）
+
+从JSONL或CSV读取问题、主题或PMID，批量检索向量数据库并调用LLM，
+结果逐条追加写入JSONL；再次运行同一命令会跳过已成功完成的条目，失败的条目会重试。
+运行结束时整理输出文件，每个id只保留一行（有成功结果时为最后一次成功的结果）。
+
+输入字段（JSONL的键或CSV的列名）:
+- question 任务: question，可选 id
+- education 任务: topic，可选 id
+- paper 任务: pmid，可选 id
+
+用法:
+    python batch_cli.py question questions.csv answers.jsonl --context-k 3
+    python batch_cli.py education topics.jsonl education.jsonl --concurrency 8
+    python batch_cli.py paper pmids.csv analyses.jsonl
+"""
+import argparse
+import csv
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from gemini_ai import MedicalAssistant, RequestScheduler, PRIORITY_BATCH
+from pubmed_api import fetch_pubmed_details
+from vector_db import MedicalVectorDB
+
+INPUT_FIELDS = {
+    "question": "question",
+    "education": "topic",
+    "paper": "pmid",
+}
+
+
+def read_items(path, task):
+    """读取输入文件，返回 [{'id': ..., 'input': ...}]"""
+    field = INPUT_FIELDS[task]
+    if path.lower().endswith(".csv"):
+        with open(path, 'r', encoding='utf-8-sig', newline='') as f:
+            rows = list(csv.DictReader(f))
+    else:
+        with open(path, 'r', encoding='utf-8') as f:
+            rows = [json.loads(line) for line in f if line.strip()]
+
+    items = []
+    seen = set()
+    for n, row in enumerate(rows, 1):
+        value = row.get(field) if isinstance(row, dict) else row
+        if value is None or str(value).strip() == "":
+            print(f"Skipping line {n}: missing '{field}'")
+            continue
+        value = str(value).strip()
+        item_id = str(row.get("id") or value) if isinstance(row, dict) else value
+        if item_id in seen:
+            print(f"Skipping line {n}: duplicate id {item_id}")
+            continue
+        seen.add(item_id)
+        items.append({"id": item_id, "input": value})
+    return items
+
+
+def completed_ids(path):
+    """读取已有输出，返回已成功完成的id"""
+    done = set()
+    if not os.path.exists(path):
+        return done
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                result = json.loads(line)
+            except json.JSONDecodeError:
+                # 上次中断时可能留下不完整的最后一行
+                continue
+            if not result.get("error"):
+                done.add(result.get("id"))
+    return done
+
+
+def compact_output(path):
+    """整理输出文件，每个id只保留一行：有成功结果时保留最后一次成功的，否则保留最后一次失败的"""
+    if not os.path.exists(path):
+        return 0
+    rows = {}
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                result = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            previous = rows.get(result.get("id"))
+            if previous is None or not result.get("error") or previous.get("error"):
+                rows[result.get("id")] = result
+    # 先写临时文件再替换，整理过程中断也不会丢失结果
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        for result in rows.values():
+            f.write(json.dumps(result, ensure_ascii=False) + "\n")
+    os.replace(tmp_path, path)
+    return len(rows)
+
+
+class BatchRunner:
+    """批量执行任务并逐条写出结果
+
+    assistant 需要以 raise_errors=True 创建，LLM调用失败才会记为失败条目。
+    """
+
+    def __init__(self, assistant, vector_db, task, output_path, concurrency=4,
+                 batch_size=32, context_k=3):
+        self.assistant = assistant
+        self.vector_db = vector_db
+        self.task = task
+        self.output_path = output_path
+        self.concurrency = concurrency
+        self.batch_size = batch_size
+        self.context_k = context_k
+        self._write_lock = threading.Lock()
+        self.succeeded = 0
+        self.failed = 0
+
+    def _write(self, result):
+        with self._write_lock:
+            with open(self.output_path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(result, ensure_ascii=False) + "\n")
+            if result["error"]:
+                self.failed += 1
+            else:
+                self.succeeded += 1
+
+    def _lookup_papers(self, pmids):
+        """优先从向量数据库查找论文，找不到的再从PubMed获取"""
+        by_pmid = {str(p.get('pmid')): p for p in self.vector_db.papers if 'pmid' in p}
+        found = {}
+        for pmid in pmids:
+            if pmid in by_pmid:
+                paper = dict(by_pmid[pmid])
+                paper.pop('embedding', None)
+                found[pmid] = paper
+        missing = [pmid for pmid in pmids if pmid not in found]
+        if missing:
+            for paper in fetch_pubmed_details(missing):
+                found[str(paper['pmid'])] = paper
+        return found
+
+    def _run_one(self, item, context):
+        """执行单个条目，context为检索到的论文或PMID对应的论文"""
+        session_id = f"batch-{item['id']}"
+        start = time.perf_counter()
+        result = {"id": item["id"], "task": self.task, "input": item["input"]}
+        try:
+            if self.task == "question":
+                answer = self.assistant.answer_medical_question(
+                    item["input"], context, session_id=session_id, priority=PRIORITY_BATCH)
+                result["context_pmids"] = [p.get('pmid') for p in context]
+            elif self.task == "education":
+                answer = self.assistant.generate_patient_education(
+                    item["input"], session_id=session_id, priority=PRIORITY_BATCH)
+            else:
+                if context is None:
+                    raise LookupError(f"PMID {item['input']} not found")
+                answer = self.assistant.parse_pubmed_article(context, session_id=session_id)
+
+            result["answer"] = answer
+            result["error"] = None
+        except Exception as e:
+            result["answer"] = None
+            result["error"] = str(e)
+        finally:
+            self.assistant.clear_history(session_id)
+        result["elapsed_s"] = round(time.perf_counter() - start, 3)
+        self._write(result)
+        return result
+
+    def _contexts(self, chunk):
+        """为一批条目准备上下文（批量检索或批量查找PMID）"""
+        if self.task == "question" and self.context_k > 0:
+            return self.vector_db.search_batch([item["input"] for item in chunk], k=self.context_k)
+        if self.task == "paper":
+            papers = self._lookup_papers([item["input"] for item in chunk])
+            return [papers.get(item["input"]) for item in chunk]
+        return [[] if self.task == "question" else None for _ in chunk]
+
+    def run(self, items):
+        """分批处理条目，每批内并发调用LLM"""
+        try:
+            with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+                for offset in range(0, len(items), self.batch_size):
+                    chunk = items[offset:offset + self.batch_size]
+                    try:
+                        contexts = self._contexts(chunk)
+                    except Exception as e:
+                        # 检索或获取论文失败时整批记为失败，重新运行时会重试
+                        print(f"Error preparing context: {e}")
+                        for item in chunk:
+                            self._write({"id": item["id"], "task": self.task, "input": item["input"],
+                                         "answer": None, "error": f"context: {e}", "elapsed_s": 0.0})
+                    else:
+                        list(executor.map(self._run_one, chunk, contexts))
+                    print(f"Processed {min(offset + len(chunk), len(items))}/{len(items)} "
+                          f"(succeeded: {self.succeeded}, failed: {self.failed})")
+        finally:
+            # 失败重试会为同一id追加多行，结束时合并
+            compact_output(self.output_path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Headless batch question answering and paper analysis")
+    parser.add_argument("task", choices=sorted(INPUT_FIELDS), help="任务类型")
+    parser.add_argument("input", help="输入文件 (.jsonl 或 .csv)")
+    parser.add_argument("output", help="输出文件 (.jsonl)，已完成的条目会在重新运行时跳过")
+    parser.add_argument("--data-dir", default="../data", help="向量数据库目录")
+    parser.add_argument("--concurrency", type=int, default=4, help="并发LLM调用数")
+    parser.add_argument("--rpm", type=int, default=60, help="每分钟请求预算（0表示不限制）")
+    parser.add_argument("--batch-size", type=int, default=32, help="每批检索的条目数")
+    parser.add_argument("--context-k", type=int, default=3, help="问答任务使用的相关论文数（0表示不检索）")
+    parser.add_argument("--fake-llm", action="store_true", help="使用本地模拟LLM后端（试运行）")
+    args = parser.parse_args()
+
+    items = read_items(args.input, args.task)
+    done = completed_ids(args.output)
+    pending = [item for item in items if item["id"] not in done]
+    print(f"Loaded {len(items)} items, {len(items) - len(pending)} already completed, {len(pending)} to run.")
+    if not pending:
+        return
+
+    backend = None
+    if args.fake_llm:
+        from fake_llm import FakeLLMBackend
+        backend = FakeLLMBackend(latency=0.05, ttft=0.01)
+    scheduler = RequestScheduler(max_concurrency=args.concurrency, requests_per_minute=args.rpm)
+    assistant = MedicalAssistant(scheduler=scheduler, backend=backend, raise_errors=True)
+    vector_db = MedicalVectorDB(data_dir=args.data_dir)
+
+    runner = BatchRunner(assistant, vector_db, args.task, args.output, concurrency=args.concurrency,
+                         batch_size=args.batch_size, context_k=args.context_k)
+    runner.run(pending)
+    print(f"Done. Succeeded: {runner.succeeded}, failed: {runner.failed}. Results in {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,266 @@
+"""
+离线基准测试
+
+使用合成语料和哈希向量模型测试XML解析、入库、建索引、检索、保存/加载和统计的耗时，
+结果以JSON输出，便于在不同提交之间比较。
+
+用法:
+    python benchmark.py --scales 1k,100k --output bench.json
+    python benchmark.py --scales 1M --dim 64 --scenarios build_index,search --output bench_1m.json
+
+注意: vector_db 以JSON列表保存向量，1M规模配合768维会占用数十GB内存，建议降低 --dim。
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import tempfile
+import time
+from datetime import datetime
+
+from pubmed_api import parse_pubmed_xml
+from synthetic_corpus import HashingEmbedder, efetch_xml, generate_records, inject_near_duplicates
+from tracing import percentile
+from vector_db import MedicalVectorDB
+
+SCENARIOS = [
+    "xml_parse", "add_papers", "add_papers_incremental", "build_index",
+    "search", "filter_search", "save_database", "load_database", "get_statistics",
+    "near_duplicates",
+]
+
+QUERIES = [
+    "metformin glycemic control in diabetes",
+    "statin therapy cardiovascular events",
+    "mRNA vaccination COVID-19 mortality",
+    "exercise training heart failure quality of life",
+    "immunotherapy lung cancer survival",
+]
+
+
+def parse_scale(text):
+    """解析规模参数，如 1k、100k、1M"""
+    text = text.strip().lower()
+    multiplier = 1
+    if text.endswith("k"):
+        multiplier, text = 1000, text[:-1]
+    elif text.endswith("m"):
+        multiplier, text = 1000000, text[:-1]
+    return int(float(text) * multiplier)
+
+
+def latency_summary(samples):
+    """将单次耗时（秒）汇总为毫秒统计"""
+    return {
+        "count": len(samples),
+        "mean_ms": round(sum(samples) / len(samples) * 1000, 4) if samples else 0.0,
+        "p50_ms": round(percentile(samples, 50) * 1000, 4),
+        "p95_ms": round(percentile(samples, 95) * 1000, 4),
+        "p99_ms": round(percentile(samples, 99) * 1000, 4),
+    }
+
+
+def git_commit():
+    """当前提交，用于比较不同版本的结果"""
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "HEAD"], cwd=os.path.dirname(os.path.abspath(__file__)),
+            stderr=subprocess.DEVNULL, text=True,
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def bench_xml_parse(records, max_docs):
+    """逐篇解析efetch XML（与 fetch_pubmed_details 的调用方式一致）"""
+    docs = [efetch_xml([r]) for r in records[:max_docs]]
+    start = time.perf_counter()
+    for record, doc in zip(records, docs):
+        parse_pubmed_xml(doc, record["pmid"])
+    elapsed = time.perf_counter() - start
+    return {
+        "docs": len(docs),
+        "bytes": sum(len(d) for d in docs),
+        "total_s": round(elapsed, 4),
+        "docs_per_s": round(len(docs) / elapsed, 1) if elapsed else None,
+    }
+
+
+def bench_near_duplicates(records, args):
+    """对比开启和关闭近似重复检测时的入库耗时与索引大小"""
+    corpus = inject_near_duplicates(records, rate=args.duplicate_rate, seed=args.seed)
+    embedder = HashingEmbedder(dim=args.dim)
+    metrics = {"input_papers": len(corpus), "injected_duplicates": len(corpus) - len(records)}
+
+    for label, threshold in (("baseline", None), ("dedup", args.duplicate_threshold)):
+        data_dir = tempfile.mkdtemp(prefix="medical_bench_dedup_")
+        try:
+            db = MedicalVectorDB(data_dir=data_dir, embedding_model=embedder, embedding_dim=args.dim,
+                                 near_duplicate_threshold=threshold)
+            start = time.perf_counter()
+            for offset in range(0, len(corpus), args.ingest_batch):
+                db.add_papers([dict(r) for r in corpus[offset:offset + args.ingest_batch]])
+            metrics[label] = {
+                "ingest_s": round(time.perf_counter() - start, 4),
+                "index_size": db.index.ntotal if db.index is not None else 0,
+                "index_bytes": (db.index.ntotal * args.dim * 4) if db.index is not None else 0,
+                "file_bytes": os.path.getsize(os.path.join(data_dir, "papers.json")),
+                "merged": db.get_statistics().get("near_duplicates", 0),
+            }
+        finally:
+            shutil.rmtree(data_dir, ignore_errors=True)
+
+    baseline, dedup = metrics["baseline"]["index_size"], metrics["dedup"]["index_size"]
+    metrics["threshold"] = args.duplicate_threshold
+    metrics["index_shrink_pct"] = round((1 - dedup / baseline) * 100, 2) if baseline else 0.0
+    return metrics
+
+
+def run_scale(scale, scenarios, args):
+    """在一个规模下运行所选场景"""
+    results = []
+    embedder = HashingEmbedder(dim=args.dim)
+    records = list(generate_records(scale, seed=args.seed))
+    data_dir = tempfile.mkdtemp(prefix="medical_bench_")
+
+    def record(scenario, metrics):
+        results.append({"scenario": scenario, "scale": scale, "metrics": metrics})
+        print(f"[{scale}] {scenario}: {json.dumps(metrics)}")
+
+    try:
+        if "xml_parse" in scenarios:
+            record("xml_parse", bench_xml_parse(records, min(scale, args.max_xml_docs)))
+
+        db = MedicalVectorDB(data_dir=data_dir, embedding_model=embedder, embedding_dim=args.dim)
+
+        # 其余场景都需要已填充的数据库
+        start = time.perf_counter()
+        db.add_papers([dict(r) for r in records])
+        elapsed = time.perf_counter() - start
+        if "add_papers" in scenarios:
+            record("add_papers", {
+                "papers": scale,
+                "total_s": round(elapsed, 4),
+                "papers_per_s": round(scale / elapsed, 1) if elapsed else None,
+            })
+
+        if "add_papers_incremental" in scenarios:
+            extra = list(generate_records(args.incremental, seed=args.seed + 1, start_pmid=90000000))
+            start = time.perf_counter()
+            db.add_papers(extra)
+            record("add_papers_incremental", {
+                "existing_papers": scale,
+                "new_papers": len(extra),
+                "total_s": round(time.perf_counter() - start, 4),
+            })
+
+        if "build_index" in scenarios:
+            samples = []
+            for _ in range(args.repeat):
+                start = time.perf_counter()
+                db._build_index()
+                samples.append(time.perf_counter() - start)
+            record("build_index", latency_summary(samples))
+
+        queries = [QUERIES[i % len(QUERIES)] + f" {i}" for i in range(args.queries)]
+
+        if "search" in scenarios:
+            samples = []
+            for query in queries:
+                start = time.perf_counter()
+                db.search(query, k=args.k)
+                samples.append(time.perf_counter() - start)
+            record("search", latency_summary(samples))
+
+        if "filter_search" in scenarios:
+            filters = {"pub_date_after": "2020", "journal": "Clinical"}
+            samples = []
+            for query in queries:
+                start = time.perf_counter()
+                db.filter_search(query, filters=filters, k=args.k)
+                samples.append(time.perf_counter() - start)
+            record("filter_search", latency_summary(samples))
+
+        papers_file = os.path.join(data_dir, "papers.json")
+        if "save_database" in scenarios:
+            start = time.perf_counter()
+            db.save_database()
+            record("save_database", {
+                "total_s": round(time.perf_counter() - start, 4),
+                "file_bytes": os.path.getsize(papers_file),
+            })
+
+        if "load_database" in scenarios:
+            if not os.path.exists(papers_file):
+                db.save_database()
+            start = time.perf_counter()
+            loaded = MedicalVectorDB(data_dir=data_dir, embedding_model=embedder, embedding_dim=args.dim)
+            record("load_database", {
+                "total_s": round(time.perf_counter() - start, 4),
+                "file_bytes": os.path.getsize(papers_file),
+                "papers": len(loaded.papers),
+            })
+            del loaded
+
+        if "get_statistics" in scenarios:
+            samples = []
+            for _ in range(args.repeat):
+                start = time.perf_counter()
+                db.get_statistics()
+                samples.append(time.perf_counter() - start)
+            record("get_statistics", latency_summary(samples))
+
+        if "near_duplicates" in scenarios:
+            record("near_duplicates", bench_near_duplicates(records, args))
+    finally:
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline benchmark suite for the medical assistant")
+    parser.add_argument("--scales", default="1k", help="逗号分隔的规模，如 1k,100k,1M")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help="逗号分隔的场景")
+    parser.add_argument("--dim", type=int, default=768, help="向量维度")
+    parser.add_argument("--queries", type=int, default=100, help="检索场景的查询次数")
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--repeat", type=int, default=5, help="建索引和统计场景的重复次数")
+    parser.add_argument("--incremental", type=int, default=10, help="增量入库的论文数")
+    parser.add_argument("--max-xml-docs", type=int, default=100000, help="XML解析场景的最大文档数")
+    parser.add_argument("--duplicate-rate", type=float, default=0.1, help="近似重复场景中注入重复论文的比例")
+    parser.add_argument("--duplicate-threshold", type=float, default=0.98, help="近似重复的余弦相似度阈值")
+    parser.add_argument("--ingest-batch", type=int, default=1000, help="近似重复场景每次入库的论文数")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", default="benchmark.json", help="结果JSON文件")
+    args = parser.parse_args()
+
+    scenarios = [s.strip() for s in args.scenarios.split(",") if s.strip()]
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"Unknown scenarios: {', '.join(sorted(unknown))}")
+
+    report = {
+        "meta": {
+            "commit": git_commit(),
+            "timestamp": datetime.now().isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "dim": args.dim,
+            "seed": args.seed,
+            "embedding_model": "HashingEmbedder",
+        },
+        "results": [],
+    }
+    for scale in (parse_scale(s) for s in args.scales.split(",")):
+        report["results"].extend(run_scale(scale, scenarios, args))
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"Wrote benchmark results to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+import hashlib
+import random
+import threading
+import time
+
+from gemini_ai import LLMBackend
+
+# 用于拼接确定性回答的词表
+WORDS = [
+    "研究", "患者", "治疗", "结果", "显示", "显著", "改善", "风险", "临床", "证据",
+    "试验", "剂量", "随访", "对照", "指南", "建议", "安全性", "有效性", "人群", "分析",
+]
+
+
+class FakeLLMError(RuntimeError):
+    """本地后端注入的模拟故障"""
+
+
+class FakeLLMBackend(LLMBackend):
+    """确定性的本地LLM后端，用于离线基准测试和压测
+
+    参数:
+    - latency: 总延迟均值（秒）
+    - latency_dist: 延迟分布，可选 constant / uniform / normal / lognormal
+    - latency_spread: 分布的离散程度（uniform为半宽，normal为标准差，lognormal为sigma）
+    - ttft: 首个token的延迟（秒），包含在总延迟内
+    - failure_rate: 注入故障的概率 (0-1)
+    - tokens: 每个回答的token数
+    - seed: 随机种子，相同种子下延迟和故障序列可复现
+    """
+
+    def __init__(self, latency=0.5, latency_dist="constant", latency_spread=0.1,
+                 ttft=0.1, failure_rate=0.0, tokens=50, seed=0):
+        if latency_dist not in ("constant", "uniform", "normal", "lognormal"):
+            raise ValueError(f"Unknown latency distribution: {latency_dist}")
+        self.latency = latency
+        self.latency_dist = latency_dist
+        self.latency_spread = latency_spread
+        self.ttft = ttft
+        self.failure_rate = failure_rate
+        self.tokens = tokens
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.calls = 0
+
+    def _sample(self):
+        """采样一次调用的总延迟和是否失败"""
+        with self._lock:
+            self.calls += 1
+            if self.latency_dist == "uniform":
+                latency = self._random.uniform(self.latency - self.latency_spread,
+                                               self.latency + self.latency_spread)
+            elif self.latency_dist == "normal":
+                latency = self._random.gauss(self.latency, self.latency_spread)
+            elif self.latency_dist == "lognormal":
+                latency = self.latency * self._random.lognormvariate(0, self.latency_spread)
+            else:
+                latency = self.latency
+            failed = self._random.random() < self.failure_rate
+        return max(latency, self.ttft, 0), failed
+
+    def _answer_tokens(self, model, messages, temperature):
+        """根据输入生成确定性的回答"""
+        digest = hashlib.sha256(repr((model, messages, temperature)).encode('utf-8')).digest()
+        rng = random.Random(digest)
+        return [rng.choice(WORDS) for _ in range(self.tokens)]
+
+    def stream(self, model, messages, temperature=0.2):
+        latency, failed = self._sample()
+        time.sleep(self.ttft)
+        if failed:
+            raise FakeLLMError("Injected failure")
+
+        tokens = self._answer_tokens(model, messages, temperature)
+        per_token = (latency - self.ttft) / len(tokens) if tokens else 0
+        for i, token in enumerate(tokens):
+            if i > 0 and per_token > 0:
+                time.sleep(per_token)
+            yield token
+
+    def chat(self, model, messages, temperature=0.2):
+        return "".join(self.stream(model, messages, temperature=temperature))
+
+
+# 测试代码
+if __name__ == "__main__":
+    backend = FakeLLMBackend(latency=0.2, ttft=0.05)
+    messages = [{"role": "user", "content": "COVID-19疫苗的有效性如何？"}]
+    print(backend.chat("fake", messages))
+    print(backend.chat("fake", messages) == backend.chat("fake", messages))
@@ -0,0 +1,133 @@
+import queue
+import threading
+import time
+
+
+class IngestionWorker:
+    """后台论文入库队列
+
+    检索结果放入有界队列后立即返回，由后台线程负责生成向量、重建索引和保存。
+    队列已满时 submit 会阻塞（背压），超时后返回 False。
+    """
+
+    def __init__(self, vector_db, max_queue_size=20, max_batch_papers=200):
+        self.vector_db = vector_db
+        self.max_batch_papers = max_batch_papers
+        self._queue = queue.Queue(maxsize=max_queue_size)
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+        # 进度统计
+        self.submitted_papers = 0
+        self.processed_papers = 0
+        self.added_papers = 0
+        self.in_progress_papers = 0
+        self.failed_batches = 0
+        self.last_error = None
+        self.last_batch_time = None
+
+    def start(self):
+        """启动后台线程"""
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="ingestion-worker", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self, timeout=None):
+        """停止后台线程（已在队列中的论文会先处理完）"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def submit(self, papers, timeout=30):
+        """提交一批论文入库
+
+        返回True表示已入队，False表示队列持续满载、等待超时。
+        """
+        if not papers:
+            return True
+        # 先计数再入队，避免后台线程处理完成时进度出现负数
+        with self._lock:
+            self.submitted_papers += len(papers)
+        try:
+            # 复制论文字典，避免后台写入embedding时影响界面正在展示的结果
+            self._queue.put([dict(p) for p in papers], timeout=timeout)
+        except queue.Full:
+            with self._lock:
+                self.submitted_papers -= len(papers)
+            print(f"Ingestion queue full, dropped {len(papers)} papers.")
+            return False
+        return True
+
+    def queue_depth(self):
+        """队列中等待处理的批次数"""
+        return self._queue.qsize()
+
+    def get_status(self):
+        """获取入库进度"""
+        with self._lock:
+            pending = self.submitted_papers - self.processed_papers
+            return {
+                "queue_depth": self._queue.qsize(),
+                "queue_capacity": self._queue.maxsize,
+                "submitted_papers": self.submitted_papers,
+                "processed_papers": self.processed_papers,
+                "added_papers": self.added_papers,
+                "in_progress_papers": self.in_progress_papers,
+                "pending_papers": pending,
+                "failed_batches": self.failed_batches,
+                "last_error": self.last_error,
+                "last_batch_time": self.last_batch_time,
+            }
+
+    def wait_idle(self, timeout=None):
+        """等待队列中所有论文处理完毕"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self._lock:
+                if self.processed_papers >= self.submitted_papers:
+                    return True
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            time.sleep(0.05)
+
+    def _drain(self):
+        """取出一批或多批论文，合并后一次入库，减少索引重建和保存次数"""
+        try:
+            batch = self._queue.get(timeout=0.5)
+        except queue.Empty:
+            return []
+        papers = list(batch)
+        while len(papers) < self.max_batch_papers:
+            try:
+                papers.extend(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return papers
+
+    def _run(self):
+        while not (self._stop.is_set() and self._queue.empty()):
+            papers = self._drain()
+            if not papers:
+                continue
+
+            with self._lock:
+                self.in_progress_papers = len(papers)
+            start = time.perf_counter()
+            added = 0
+            try:
+                # 使用add_papers的返回值计数，不受其他写入者（订阅同步、清空数据库）影响
+                added = self.vector_db.add_papers(papers) or 0
+            except Exception as e:
+                print(f"Error ingesting papers: {e}")
+                with self._lock:
+                    self.failed_batches += 1
+                    self.last_error = str(e)
+            finally:
+                with self._lock:
+                    self.added_papers += int(added)
+                    self.processed_papers += len(papers)
+                    self.in_progress_papers = 0
+                    self.last_batch_time = time.perf_counter() - start
@@ -0,0 +1,120 @@
+"""
+LLM调用链路压测工具
+
+使用本地FakeLLMBackend并发驱动 answer_medical_question 和 analyze_multiple_papers，
+统计吞吐量和 p50/p95/p99 延迟，无需网络。
+
+用法:
+    python load_test.py --requests 200 --concurrency 16 --latency 0.3 --latency-dist lognormal
+"""
+import argparse
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from gemini_ai import MedicalAssistant, RequestScheduler
+from fake_llm import FakeLLMBackend
+from tracing import percentile
+
+
+def make_papers(n, offset=0):
+    """生成用作上下文的示例论文"""
+    return [
+        {
+            "pmid": str(100000 + offset + i),
+            "title": f"Synthetic study {offset + i} on cardiovascular outcomes",
+            "abstract": f"This randomized trial {offset + i} evaluates treatment effects...",
+            "authors": "Smith J, Johnson A",
+            "source": "Journal of Medical Research",
+            "pub_date": "2023-01-15",
+        }
+        for i in range(n)
+    ]
+
+
+def run_load_test(assistant, num_requests=100, concurrency=8, analysis_ratio=0.2,
+                  distinct_prompts=None):
+    """并发发送请求并统计延迟
+
+    assistant 需要以 raise_errors=True 创建，失败的调用才会计入错误数。
+    distinct_prompts 限制不同问题的数量，用于观察在途请求合并的效果。
+    """
+    analysis_every = int(round(1 / analysis_ratio)) if analysis_ratio > 0 else 0
+
+    def one_request(i):
+        n = i % distinct_prompts if distinct_prompts else i
+        session_id = f"load-{i}"
+        start = time.perf_counter()
+        ok = True
+        try:
+            if analysis_every and i % analysis_every == 0:
+                kind = "analyze_multiple_papers"
+                assistant.analyze_multiple_papers(make_papers(3, offset=n), session_id=session_id)
+            else:
+                kind = "answer_medical_question"
+                assistant.answer_medical_question(
+                    f"问题 {n}: 该治疗方案的长期疗效如何？", make_papers(2, offset=n), session_id=session_id)
+        except Exception:
+            ok = False
+        elapsed = time.perf_counter() - start
+        assistant.clear_history(session_id)
+        return kind, elapsed, ok
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        samples = list(executor.map(one_request, range(num_requests)))
+    wall_time = time.perf_counter() - start
+
+    report = {
+        "requests": num_requests,
+        "concurrency": concurrency,
+        "wall_time_s": round(wall_time, 4),
+        "throughput_rps": round(num_requests / wall_time, 3) if wall_time else 0.0,
+        "errors": sum(1 for _, _, ok in samples if not ok),
+        "by_kind": {},
+    }
+    groups = {"all": list(samples)}
+    for s in samples:
+        groups.setdefault(s[0], []).append(s)
+    for kind, group in groups.items():
+        latencies = [elapsed for _, elapsed, _ in group]
+        report["by_kind"][kind] = {
+            "count": len(group),
+            "p50_s": round(percentile(latencies, 50), 4),
+            "p95_s": round(percentile(latencies, 95), 4),
+            "p99_s": round(percentile(latencies, 99), 4),
+        }
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test MedicalAssistant with a local fake LLM backend")
+    parser.add_argument("--requests", type=int, default=100, help="总请求数")
+    parser.add_argument("--concurrency", type=int, default=8, help="客户端并发数")
+    parser.add_argument("--analysis-ratio", type=float, default=0.2, help="多篇论文分析请求占比")
+    parser.add_argument("--distinct-prompts", type=int, default=None, help="不同问题的数量（默认全部不同）")
+    parser.add_argument("--max-concurrency", type=int, default=4, help="调度器最大并发数")
+    parser.add_argument("--rpm", type=int, default=0, help="每分钟请求预算（0表示不限制）")
+    parser.add_argument("--latency", type=float, default=0.3, help="平均延迟（秒）")
+    parser.add_argument("--latency-dist", default="constant",
+                        choices=["constant", "uniform", "normal", "lognormal"])
+    parser.add_argument("--latency-spread", type=float, default=0.1)
+    parser.add_argument("--ttft", type=float, default=0.05, help="首token延迟（秒）")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="故障注入概率")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    backend = FakeLLMBackend(latency=args.latency, latency_dist=args.latency_dist,
+                             latency_spread=args.latency_spread, ttft=args.ttft,
+                             failure_rate=args.failure_rate, seed=args.seed)
+    scheduler = RequestScheduler(max_concurrency=args.max_concurrency, requests_per_minute=args.rpm)
+    assistant = MedicalAssistant(model="fake", scheduler=scheduler, backend=backend, raise_errors=True)
+
+    report = run_load_test(assistant, num_requests=args.requests, concurrency=args.concurrency,
+                           analysis_ratio=args.analysis_ratio, distinct_prompts=args.distinct_prompts)
+    report["upstream_calls"] = backend.calls
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
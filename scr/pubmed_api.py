@@ -1,82 +1,98 @@
+import os
 import requests
 import xml.etree.ElementTree as ET
 from datetime import datetime
+from tracing import span
+
+# E-utilities地址，可通过环境变量指向本地的模拟服务（见 stub_eutils.py）
+EUTILS_BASE_URL = os.environ.get("EUTILS_BASE_URL", "https://eutils.ncbi.nlm.nih.gov/entrez/eutils")
+
+def parse_pubmed_xml(content, pmid):
+    """解析efetch返回的XML，提取论文信息
+
+    XML格式错误时抛出 ET.ParseError
+    """
+    root = ET.fromstring(content)
+    article_data = {}
+    
+    # 获取PMID
+    article_data['pmid'] = pmid
+    
+    # 获取标题
+    title_element = root.find(".//ArticleTitle")
+    if title_element is not None and title_element.text:
+        article_data['title'] = title_element.text
+    else:
+        article_data['title'] = "No title available"
+    
+    # 获取摘要
+    abstract_texts = root.findall(".//AbstractText")
+    if abstract_texts:
+        abstract = " ".join([text.text for text in abstract_texts if text.text])
+        article_data['abstract'] = abstract
+    else:
+        article_data['abstract'] = "No abstract available"
+    
+    # 获取作者
+    author_list = root.findall(".//Author")
+    authors = []
+    for author in author_list:
+        last_name = author.find("LastName")
+        fore_name = author.find("ForeName")
+        if last_name is not None and last_name.text:
+            author_name = last_name.text
+            if fore_name is not None and fore_name.text:
+                author_name = f"{fore_name.text} {author_name}"
+            authors.append(author_name)
+    
+    article_data['authors'] = ", ".join(authors) if authors else "Unknown authors"
+    
+    # 获取期刊信息
+    journal = root.find(".//Journal/Title")
+    if journal is not None and journal.text:
+        article_data['source'] = journal.text
+    else:
+        article_data['source'] = "Unknown journal"
+    
+    # 获取发布日期
+    pub_date_elements = root.findall(".//PubDate/*")
+    pub_date = {}
+    for element in pub_date_elements:
+        if element.tag in ['Year', 'Month', 'Day'] and element.text:
+            pub_date[element.tag.lower()] = element.text
+    
+    if 'year' in pub_date:
+        date_str = pub_date['year']
+        if 'month' in pub_date:
+            date_str += f"-{pub_date['month']}"
+            if 'day' in pub_date:
+                date_str += f"-{pub_date['day']}"
+        article_data['pub_date'] = date_str
+    else:
+        article_data['pub_date'] = "Unknown publication date"
+    
+    # 获取DOI
+    article_id_list = root.findall(".//ArticleId")
+    for article_id in article_id_list:
+        if article_id.get("IdType") == "doi" and article_id.text:
+            article_data['doi'] = article_id.text
+            break
+    
+    return article_data
 
 def fetch_pubmed_details(ids):
     """获取PubMed文章的详细信息"""
     details = []
     for pmid in ids:
-        url = f"https://eutils.ncbi.nlm.nih.gov/entrez/eutils/efetch.fcgi?db=pubmed&id={pmid}&retmode=xml"
-        response = requests.get(url)
+        url = f"{EUTILS_BASE_URL}/efetch.fcgi?db=pubmed&id={pmid}&retmode=xml"
+        with span("pubmed.efetch", pmid=pmid) as s:
+            response = requests.get(url)
+            s.set("status", response.status_code)
+            s.set("bytes", len(response.content))
         if response.status_code == 200:
             try:
-                root = ET.fromstring(response.content)
-                article_data = {}
-                
-                # 获取PMID
-                article_data['pmid'] = pmid
-                
-                # 获取标题
-                title_element = root.find(".//ArticleTitle")
-                if title_element is not None and title_element.text:
-                    article_data['title'] = title_element.text
-                else:
-                    article_data['title'] = "No title available"
-                
-                # 获取摘要
-                abstract_texts = root.findall(".//AbstractText")
-                if abstract_texts:
-                    abstract = " ".join([text.text for text in abstract_texts if text.text])
-                    article_data['abstract'] = abstract
-                else:
-                    article_data['abstract'] = "No abstract available"
-                
-                # 获取作者
-                author_list = root.findall(".//Author")
-                authors = []
-                for author in author_list:
-                    last_name = author.find("LastName")
-                    fore_name = author.find("ForeName")
-                    if last_name is not None and last_name.text:
-                        author_name = last_name.text
-                        if fore_name is not None and fore_name.text:
-                            author_name = f"{fore_name.text} {author_name}"
-                        authors.append(author_name)
-                
-                article_data['authors'] = ", ".join(authors) if authors else "Unknown authors"
-                
-                # 获取期刊信息
-                journal = root.find(".//Journal/Title")
-                if journal is not None and journal.text:
-                    article_data['source'] = journal.text
-                else:
-                    article_data['source'] = "Unknown journal"
-                
-                # 获取发布日期
-                pub_date_elements = root.findall(".//PubDate/*")
-                pub_date = {}
-                for element in pub_date_elements:
-                    if element.tag in ['Year', 'Month', 'Day'] and element.text:
-                        pub_date[element.tag.lower()] = element.text
-                
-                if 'year' in pub_date:
-                    date_str = pub_date['year']
-                    if 'month' in pub_date:
-                        date_str += f"-{pub_date['month']}"
-                        if 'day' in pub_date:
-                            date_str += f"-{pub_date['day']}"
-                    article_data['pub_date'] = date_str
-                else:
-                    article_data['pub_date'] = "Unknown publication date"
-                
-                # 获取DOI
-                article_id_list = root.findall(".//ArticleId")
-                for article_id in article_id_list:
-                    if article_id.get("IdType") == "doi" and article_id.text:
-                        article_data['doi'] = article_id.text
-                        break
-                
-                details.append(article_data)
+                with span("pubmed.parse_xml", pmid=pmid, bytes=len(response.content)):
+                    details.append(parse_pubmed_xml(response.content, pmid))
             except ET.ParseError as e:
                 print(f"Error parsing XML for PMID {pmid}: {e}")
         else:
@@ -84,31 +100,42 @@ def fetch_pubmed_details(ids):
     
     return details
 
-def search_pubmed(query, max_results=5, days=30):
+def search_pubmed_ids(query, max_results=5, days=30, mindate=None, maxdate=None,
+                      datetype="pdat", retstart=0):
     """
-    搜索PubMed最新研究论文
+    搜索PubMed，只返回PMID列表
     
     参数:
     - query: 搜索查询
     - max_results: 返回的最大结果数
-    - days: 最近几天的论文 (0表示不限制时间)
+    - days: 最近几天的论文 (0表示不限制时间)，指定mindate时忽略
+    - mindate/maxdate: 日期范围，格式 YYYY/MM/DD
+    - datetype: 日期类型，pdat为发表日期，edat为收录日期
+    - retstart: 分页起始位置
     
     返回:
-    - 论文详情列表
+    - PMID列表；HTTP错误或XML解析失败时返回None，以便与"没有结果"区分
     """
     # 构建日期限制
     date_filter = ""
-    if days > 0:
+    date_params = ""
+    if mindate:
+        date_params = f"&datetype={datetype}&mindate={mindate}&maxdate={maxdate or '3000'}"
+    elif days > 0:
         date_filter = f" AND {days}[pdat]"
     
     # 构建搜索URL
     search_url = (
-        f"https://eutils.ncbi.nlm.nih.gov/entrez/eutils/esearch.fcgi"
-        f"?db=pubmed&term={query}{date_filter}"
-        f"&retmax={max_results}&retmode=xml&sort=date"
+        f"{EUTILS_BASE_URL}/esearch.fcgi"
+        f"?db=pubmed&term={query}{date_filter}{date_params}"
+        f"&retmax={max_results}&retstart={retstart}&retmode=xml&sort=date"
     )
     
-    response = requests.get(search_url)
+    with span("pubmed.esearch", query=query, max_results=max_results, days=days,
+              mindate=mindate, maxdate=maxdate) as s:
+        response = requests.get(search_url)
+        s.set("status", response.status_code)
+        s.set("bytes", len(response.content))
     
     if response.status_code == 200:
         try:
@@ -121,14 +148,34 @@ def search_pubmed(query, max_results=5, days=30):
             
             ids = [id_elem.text for id_elem in id_elements if id_elem.text]
             print(f"Found {len(ids)} PubMed IDs: {', '.join(ids)}")
-            
-            return fetch_pubmed_details(ids)
+            return ids
         except ET.ParseError as e:
             print(f"Error parsing XML response: {e}")
-            return []
+            return None
     else:
         print(f"Error searching PubMed: {response.status_code}")
+        return None
+
+def search_pubmed(query, max_results=5, days=30):
+    """
+    搜索PubMed最新研究论文
+    
+    参数:
+    - query: 搜索查询
+    - max_results: 返回的最大结果数
+    - days: 最近几天的论文 (0表示不限制时间)
+    
+    返回:
+    - 论文详情列表
+    """
+    ids = search_pubmed_ids(query, max_results=max_results, days=days)
+    if not ids:
         return []
+    
+    with span("pubmed.fetch_details", count=len(ids)) as s:
+        details = fetch_pubmed_details(ids)
+        s.set("fetched", len(details))
+    return details
 
 if __name__ == "__main__":
     # 测试搜索功能
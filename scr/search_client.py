@@ -0,0 +1,117 @@
+import requests
+
+
+class SearchServiceClient:
+    """search_service 的同步客户端，接口与 MedicalVectorDB 的常用方法一致
+
+    app.py 设置 SEARCH_SERVICE_URL 后用它代替本地的 MedicalVectorDB，
+    各个Streamlit worker不再各自加载模型和索引。
+    论文数据只保存在服务端，客户端没有 papers 属性：已入库的PMID通过 known_pmids 查询，
+    检索结果的后台入库直接使用服务端的入库队列（submit/queue_depth/get_status，
+    与 IngestionWorker 的接口一致），不需要在本地再包一层 IngestionWorker。
+    """
+
+    def __init__(self, base_url, timeout=30, ingest_timeout=300, data_dir='../data'):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+        # 同步入库需要等待服务端生成向量和保存，超时时间更长
+        self.ingest_timeout = ingest_timeout
+        # 订阅等功能仍在本地保存数据
+        self.data_dir = data_dir
+        self.session = requests.Session()
+
+    def _request(self, method, path, payload=None, timeout=None):
+        response = self.session.request(method, f"{self.base_url}{path}", json=payload,
+                                        timeout=timeout or self.timeout)
+        if response.status_code >= 400:
+            try:
+                message = response.json().get('error', response.text)
+            except ValueError:
+                message = response.text
+            raise RuntimeError(f"Search service error {response.status_code}: {message}")
+        return response.json()
+
+    def search(self, query, k=5):
+        """搜索与查询最相关的论文"""
+        try:
+            return self._request('POST', '/search', {'query': query, 'k': k})['results']
+        except (requests.RequestException, RuntimeError) as e:
+            print(f"Error searching via service: {e}")
+            return []
+
+    def search_batch(self, queries, k=5):
+        """一次请求发送所有查询，服务端与其他并发查询一起合并为批量检索"""
+        if not queries:
+            return []
+        try:
+            return self._request('POST', '/search_batch', {'queries': list(queries), 'k': k})['results']
+        except (requests.RequestException, RuntimeError) as e:
+            print(f"Error searching via service: {e}")
+            return [[] for _ in queries]
+
+    def filter_search(self, query, filters=None, k=5):
+        """带过滤条件的搜索"""
+        try:
+            return self._request('POST', '/filter_search', {'query': query, 'filters': filters, 'k': k})['results']
+        except (requests.RequestException, RuntimeError) as e:
+            print(f"Error searching via service: {e}")
+            return []
+
+    def known_pmids(self):
+        """服务端已入库的PMID（包括已归并的近似重复论文）"""
+        return set(self._request('GET', '/pmids')['pmids'])
+
+    def add_papers(self, new_papers):
+        """在服务端同步入库，与 MedicalVectorDB.add_papers 一样在失败时抛出异常"""
+        if not new_papers:
+            return False
+        return self._request('POST', '/ingest', {'papers': new_papers, 'wait': True},
+                             timeout=self.ingest_timeout)['added']
+
+    def submit(self, papers, timeout=30):
+        """提交论文到服务端的入库队列，队列已满或请求失败时返回False
+
+        timeout 为队列满时服务端最多等待的秒数（上限30秒），HTTP超时在此基础上再留出 self.timeout，
+        保证能收到服务端的503而不是先超时。
+        """
+        if not papers:
+            return True
+        wait_s = 30 if timeout is None else timeout
+        try:
+            self._request('POST', '/ingest', {'papers': papers, 'wait_s': wait_s},
+                          timeout=wait_s + self.timeout)
+            return True
+        except (requests.RequestException, RuntimeError) as e:
+            print(f"Error submitting papers to service: {e}")
+            return False
+
+    def get_status(self):
+        """服务端入库队列的进度"""
+        try:
+            return self._request('GET', '/stats')['ingestion']
+        except (requests.RequestException, RuntimeError) as e:
+            print(f"Error fetching ingestion status: {e}")
+            return {"queue_depth": 0, "queue_capacity": 0, "submitted_papers": 0, "processed_papers": 0,
+                    "added_papers": 0, "in_progress_papers": 0, "pending_papers": 0, "failed_batches": 0,
+                    "last_error": str(e), "last_batch_time": None}
+
+    def queue_depth(self):
+        """服务端队列中等待处理的批次数"""
+        return self.get_status()["queue_depth"]
+
+    def get_statistics(self):
+        """获取数据库统计信息"""
+        try:
+            return self._request('GET', '/stats')['database']
+        except (requests.RequestException, RuntimeError) as e:
+            print(f"Error fetching statistics: {e}")
+            return {"total_papers": 0}
+
+    def clear_database(self):
+        """清空数据库"""
+        try:
+            self._request('POST', '/clear')
+            return True
+        except (requests.RequestException, RuntimeError) as e:
+            print(f"Error clearing database: {e}")
+            return False
@@ -0,0 +1,117 @@
+"""
+检索服务压测工具
+
+并发向 search_service 发送 search / filter_search 请求，统计吞吐量、p50/p95/p99 延迟
+以及服务端的平均批大小。
+
+用法:
+    # 先用合成语料启动离线服务
+    python search_load_test.py --seed-corpus 10000 --data-dir /tmp/search_bench
+    python search_service.py --data-dir /tmp/search_bench --hash-embedding 128 --port 8800
+    # 再压测
+    python search_load_test.py --url http://127.0.0.1:8800 --requests 5000 --concurrency 64
+"""
+import argparse
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from tracing import percentile
+
+QUERIES = [
+    "metformin glycemic control in diabetes",
+    "statin therapy cardiovascular events",
+    "mRNA vaccination COVID-19 mortality",
+    "exercise training heart failure quality of life",
+    "immunotherapy lung cancer survival",
+    "anticoagulation atrial fibrillation stroke",
+    "cognitive behavioral therapy depression",
+    "SGLT2 inhibitors chronic kidney disease",
+]
+
+
+def seed_corpus(data_dir, count, dim, seed=42):
+    """用合成语料和哈希向量模型生成一个离线数据库"""
+    from synthetic_corpus import HashingEmbedder, generate_records
+    from vector_db import MedicalVectorDB
+
+    # 同时写出索引文件，供服务以内存映射方式加载
+    db = MedicalVectorDB(data_dir=data_dir, embedding_model=HashingEmbedder(dim=dim), embedding_dim=dim,
+                         mmap_index=True)
+    db.add_papers(list(generate_records(count, seed=seed)))
+    print(f"Seeded {len(db.papers)} papers into {data_dir}")
+
+
+def run_load_test(url, num_requests=1000, concurrency=32, k=5, filter_ratio=0.2, distinct_queries=None):
+    """并发发送请求并统计延迟"""
+    local = threading.local()
+    filter_every = int(round(1 / filter_ratio)) if filter_ratio > 0 else 0
+
+    def one_request(i):
+        if not hasattr(local, "session"):
+            local.session = requests.Session()
+        n = i % distinct_queries if distinct_queries else i
+        query = f"{QUERIES[n % len(QUERIES)]} {n}"
+        if filter_every and i % filter_every == 0:
+            path, payload = "/filter_search", {"query": query, "k": k, "filters": {"pub_date_after": "2020"}}
+        else:
+            path, payload = "/search", {"query": query, "k": k}
+        start = time.perf_counter()
+        try:
+            ok = local.session.post(url + path, json=payload, timeout=60).status_code == 200
+        except requests.RequestException:
+            ok = False
+        return path, time.perf_counter() - start, ok
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        samples = list(executor.map(one_request, range(num_requests)))
+    wall_time = time.perf_counter() - start
+
+    latencies = [elapsed for _, elapsed, _ in samples]
+    report = {
+        "requests": num_requests,
+        "concurrency": concurrency,
+        "wall_time_s": round(wall_time, 4),
+        "throughput_rps": round(num_requests / wall_time, 1) if wall_time else 0.0,
+        "errors": sum(1 for _, _, ok in samples if not ok),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 3),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 3),
+    }
+    try:
+        report["service"] = requests.get(url + "/stats", timeout=30).json().get("service")
+    except (requests.RequestException, ValueError):
+        pass
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the async search service")
+    parser.add_argument("--url", default="http://127.0.0.1:8800", help="服务地址")
+    parser.add_argument("--requests", type=int, default=1000, help="总请求数")
+    parser.add_argument("--concurrency", type=int, default=32, help="客户端并发数")
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--filter-ratio", type=float, default=0.2, help="filter_search 请求占比")
+    parser.add_argument("--distinct-queries", type=int, default=None, help="不同查询的数量（默认全部不同）")
+    parser.add_argument("--seed-corpus", type=int, default=None, metavar="N",
+                        help="只生成N篇合成论文的离线数据库后退出")
+    parser.add_argument("--data-dir", default="../data", help="--seed-corpus 的输出目录")
+    parser.add_argument("--dim", type=int, default=128, help="--seed-corpus 使用的向量维度")
+    args = parser.parse_args()
+
+    if args.seed_corpus:
+        seed_corpus(args.data_dir, args.seed_corpus, args.dim)
+        return
+
+    url = args.url.rstrip("/")
+    report = run_load_test(url, num_requests=args.requests, concurrency=args.concurrency, k=args.k,
+                           filter_ratio=args.filter_ratio, distinct_queries=args.distinct_queries)
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,362 @@
+"""
+异步JSON检索服务
+
+在一个进程中共享同一个向量数据库（内存映射的FAISS索引）和句向量模型，
+通过HTTP为Streamlit各个worker和其他内部工具提供检索。
+并发到达的查询会被合并为一次批量编码和FAISS检索，CPU计算在线程池中执行，
+事件循环始终保持响应。
+
+接口（JSON）:
+- POST /search          {"query": "...", "k": 5}
+- POST /search_batch    {"queries": ["...", ...], "k": 5}
+- POST /filter_search   {"query": "...", "filters": {...}, "k": 5}
+- GET  /stats
+- GET  /pmids           已入库的PMID（包括已归并的近似重复论文）
+- POST /ingest          {"papers": [...]}  交给后台入库队列，返回202；
+                        加 "wait": true 时在本次请求中直接入库，完成后返回200
+- POST /clear
+- GET  /health
+
+用法:
+    python search_service.py --data-dir ../data --port 8800
+    python search_service.py --hash-embedding 128 --port 8800   # 离线测试
+"""
+import argparse
+import asyncio
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
+
+from ingest_queue import IngestionWorker
+from tracing import span
+from vector_db import MedicalVectorDB
+
+MAX_BODY_BYTES = 50 * 1024 * 1024
+MAX_K = 1000
+MAX_BATCH_QUERIES = 256
+# 入库队列满时最多等待的秒数
+MAX_INGEST_WAIT_S = 30
+FILTER_KEYS = ("pub_date_after", "author", "journal")
+
+
+class HTTPError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+class QueryBatcher:
+    """将并发到达的查询合并为批量检索
+
+    收到第一个查询后最多等待 max_wait_ms 或凑满 max_batch 个查询，
+    相同的查询文本只编码一次，每批只调用一次 search_batch。
+    """
+
+    def __init__(self, vector_db, executor, max_batch=64, max_wait_ms=5):
+        self.vector_db = vector_db
+        self.executor = executor
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        self._queue = None
+        self._task = None
+        self.batches = 0
+        self.queries = 0
+
+    def start(self):
+        self._queue = asyncio.Queue()
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+
+    async def search(self, query, k=5, filters=None):
+        """提交一个查询，等待所在批次完成"""
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((query, k, filters, future))
+        return await future
+
+    async def _collect(self):
+        """收集一批查询"""
+        batch = [await self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    def _search_batch(self, batch):
+        """在线程池中执行：去重后批量检索，再按各自的k和过滤条件切分结果"""
+        unique_queries = list(dict.fromkeys(query for query, _, _, _ in batch))
+        # filter_search 先多取结果再过滤，与 MedicalVectorDB.filter_search 保持一致
+        fetch_k = max(k * 3 if filters else k for _, k, filters, _ in batch)
+        with span("search_service.batch", queries=len(batch), unique=len(unique_queries)):
+            results = self.vector_db.search_batch(unique_queries, k=fetch_k)
+        by_query = dict(zip(unique_queries, results))
+        return [MedicalVectorDB.apply_filters(by_query[query], filters, k) for query, k, filters, _ in batch]
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._collect()
+            self.batches += 1
+            self.queries += len(batch)
+            try:
+                results = await loop.run_in_executor(self.executor, self._search_batch, batch)
+            except Exception as e:
+                for *_, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            for (*_, future), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result)
+
+
+class SearchService:
+    """基于asyncio的轻量HTTP/1.1 JSON服务"""
+
+    def __init__(self, vector_db, max_batch=64, max_wait_ms=5, workers=2, max_queue_size=20):
+        self.vector_db = vector_db
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="search")
+        self.batcher = QueryBatcher(vector_db, self.executor, max_batch=max_batch, max_wait_ms=max_wait_ms)
+        self.ingestion_worker = IngestionWorker(vector_db, max_queue_size=max_queue_size)
+        self.started = time.time()
+        self.requests = 0
+
+    @staticmethod
+    def _parse_k(body):
+        k = body.get("k", 5)
+        # bool 是 int 的子类，需要单独排除
+        if isinstance(k, bool) or not isinstance(k, int) or not 1 <= k <= MAX_K:
+            raise HTTPError(HTTPStatus.BAD_REQUEST, f"'k' must be an integer between 1 and {MAX_K}")
+        return k
+
+    @staticmethod
+    def _parse_wait_s(body):
+        wait_s = body.get("wait_s", MAX_INGEST_WAIT_S)
+        if isinstance(wait_s, bool) or not isinstance(wait_s, (int, float)) or wait_s < 0:
+            raise HTTPError(HTTPStatus.BAD_REQUEST, "'wait_s' must be a non-negative number")
+        return min(wait_s, MAX_INGEST_WAIT_S)
+
+    @staticmethod
+    def _parse_filters(body):
+        filters = body.get("filters")
+        if filters is None:
+            return None
+        if not isinstance(filters, dict):
+            raise HTTPError(HTTPStatus.BAD_REQUEST, "'filters' must be an object")
+        for key, value in filters.items():
+            if key not in FILTER_KEYS:
+                raise HTTPError(HTTPStatus.BAD_REQUEST, f"Unknown filter '{key}'")
+            if not isinstance(value, str):
+                raise HTTPError(HTTPStatus.BAD_REQUEST, f"Filter '{key}' must be a string")
+        return filters
+
+    async def handle_search(self, body, with_filters=False):
+        query = body.get("query")
+        if not isinstance(query, str) or not query.strip():
+            raise HTTPError(HTTPStatus.BAD_REQUEST, "'query' must be a non-empty string")
+        k = self._parse_k(body)
+        filters = self._parse_filters(body) if with_filters else None
+        results = await self.batcher.search(query, k=k, filters=filters)
+        return HTTPStatus.OK, {"results": results}
+
+    async def handle_search_batch(self, body):
+        queries = body.get("queries")
+        if not isinstance(queries, list) or not all(isinstance(q, str) and q.strip() for q in queries):
+            raise HTTPError(HTTPStatus.BAD_REQUEST, "'queries' must be a list of non-empty strings")
+        if len(queries) > MAX_BATCH_QUERIES:
+            raise HTTPError(HTTPStatus.BAD_REQUEST, f"At most {MAX_BATCH_QUERIES} queries per request")
+        k = self._parse_k(body)
+        # 同时提交给 QueryBatcher，与其他请求的查询一起合并为批量检索
+        results = await asyncio.gather(*(self.batcher.search(query, k=k) for query in queries))
+        return HTTPStatus.OK, {"results": list(results)}
+
+    async def handle_stats(self):
+        loop = asyncio.get_running_loop()
+        stats = await loop.run_in_executor(self.executor, self.vector_db.get_statistics)
+        return HTTPStatus.OK, {
+            "database": stats,
+            "service": {
+                "uptime_s": round(time.time() - self.started, 1),
+                "requests": self.requests,
+                "batches": self.batcher.batches,
+                "batched_queries": self.batcher.queries,
+                "avg_batch_size": round(self.batcher.queries / self.batcher.batches, 2)
+                if self.batcher.batches else 0.0,
+            },
+            "ingestion": self.ingestion_worker.get_status(),
+        }
+
+    async def handle_pmids(self):
+        loop = asyncio.get_running_loop()
+        pmids = await loop.run_in_executor(self.executor, self.vector_db.known_pmids)
+        return HTTPStatus.OK, {"pmids": sorted(pmids)}
+
+    async def handle_ingest(self, body):
+        papers = body.get("papers")
+        if not isinstance(papers, list) or not all(isinstance(p, dict) for p in papers):
+            raise HTTPError(HTTPStatus.BAD_REQUEST, "'papers' must be a list of objects")
+        wait_s = self._parse_wait_s(body)
+        loop = asyncio.get_running_loop()
+        if body.get("wait"):
+            # 同步入库：调用方（如订阅同步）需要知道入库是否成功
+            added = await loop.run_in_executor(None, self.vector_db.add_papers, papers)
+            return HTTPStatus.OK, {"added": added, "total_papers": len(self.vector_db.papers)}
+        # 队列满时 submit 最多阻塞 wait_s 秒，放到线程池中等待以免阻塞事件循环
+        queued = await loop.run_in_executor(None, self.ingestion_worker.submit, papers, wait_s)
+        if not queued:
+            raise HTTPError(HTTPStatus.SERVICE_UNAVAILABLE, "Ingestion queue is full")
+        return HTTPStatus.ACCEPTED, {"queued": len(papers), "queue_depth": self.ingestion_worker.queue_depth()}
+
+    async def handle_clear(self):
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self.executor, self.vector_db.clear_database)
+        return HTTPStatus.OK, {"cleared": True}
+
+    async def dispatch(self, method, path, body):
+        self.requests += 1
+        if method == "GET" and path == "/health":
+            return HTTPStatus.OK, {"status": "ok"}
+        if method == "GET" and path == "/stats":
+            return await self.handle_stats()
+        if method == "POST" and path == "/search":
+            return await self.handle_search(body)
+        if method == "POST" and path == "/search_batch":
+            return await self.handle_search_batch(body)
+        if method == "POST" and path == "/filter_search":
+            return await self.handle_search(body, with_filters=True)
+        if method == "GET" and path == "/pmids":
+            return await self.handle_pmids()
+        if method == "POST" and path == "/ingest":
+            return await self.handle_ingest(body)
+        if method == "POST" and path == "/clear":
+            return await self.handle_clear()
+        raise HTTPError(HTTPStatus.NOT_FOUND, f"No route for {method} {path}")
+
+    async def _read_request(self, reader):
+        """读取一个请求，连接关闭时返回None"""
+        request_line = await reader.readline()
+        if not request_line:
+            return None
+        try:
+            method, target, version = request_line.decode("latin-1").split()
+        except ValueError:
+            raise HTTPError(HTTPStatus.BAD_REQUEST, "Malformed request line")
+
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+
+        try:
+            length = int(headers.get("content-length", "0"))
+        except ValueError:
+            raise HTTPError(HTTPStatus.BAD_REQUEST, "Invalid Content-Length")
+        if length < 0:
+            raise HTTPError(HTTPStatus.BAD_REQUEST, "Invalid Content-Length")
+        if length > MAX_BODY_BYTES:
+            raise HTTPError(HTTPStatus.REQUEST_ENTITY_TOO_LARGE, "Request body too large")
+        body = {}
+        if length:
+            try:
+                body = json.loads(await reader.readexactly(length))
+            except json.JSONDecodeError:
+                raise HTTPError(HTTPStatus.BAD_REQUEST, "Body must be valid JSON")
+            if not isinstance(body, dict):
+                raise HTTPError(HTTPStatus.BAD_REQUEST, "Body must be a JSON object")
+
+        keep_alive = headers.get("connection", "").lower() != "close" and version == "HTTP/1.1"
+        return method, target.split("?", 1)[0], body, keep_alive
+
+    @staticmethod
+    def _write_response(writer, status, payload, keep_alive):
+        data = json.dumps(payload, ensure_ascii=False, default=str).encode("utf-8")
+        writer.write(
+            f"HTTP/1.1 {status.value} {status.phrase}\r\n"
+            f"Content-Type: application/json; charset=utf-8\r\n"
+            f"Content-Length: {len(data)}\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode("latin-1") + data
+        )
+
+    async def handle_connection(self, reader, writer):
+        try:
+            while True:
+                try:
+                    request = await self._read_request(reader)
+                    if request is None:
+                        break
+                    method, path, body, keep_alive = request
+                    status, payload = await self.dispatch(method, path, body)
+                except HTTPError as e:
+                    status, payload, keep_alive = e.status, {"error": str(e)}, False
+                except (asyncio.IncompleteReadError, ConnectionError):
+                    break
+                except Exception as e:
+                    print(f"Error handling request: {e}")
+                    status, payload, keep_alive = HTTPStatus.INTERNAL_SERVER_ERROR, {"error": str(e)}, False
+                self._write_response(writer, status, payload, keep_alive)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host="127.0.0.1", port=8800):
+        self.batcher.start()
+        self.ingestion_worker.start()
+        server = await asyncio.start_server(self.handle_connection, host, port)
+        print(f"Search service listening on http://{host}:{port} ({len(self.vector_db.papers)} papers)")
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            await self.batcher.stop()
+            self.ingestion_worker.stop(timeout=30)
+            self.executor.shutdown(wait=False)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Async JSON search service for MedicalVectorDB")
+    parser.add_argument("--data-dir", default="../data", help="向量数据库目录")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8800)
+    parser.add_argument("--max-batch", type=int, default=64, help="每批最多合并的查询数")
+    parser.add_argument("--max-wait-ms", type=float, default=5, help="凑批的最长等待时间（毫秒）")
+    parser.add_argument("--workers", type=int, default=2, help="执行编码和检索的线程数")
+    parser.add_argument("--no-mmap", action="store_true", help="不使用内存映射加载索引")
+    parser.add_argument("--hash-embedding", type=int, default=None, metavar="DIM",
+                        help="使用指定维度的哈希向量模型代替PubMedBERT（离线测试）")
+    args = parser.parse_args()
+
+    embedding_model = None
+    embedding_dim = 768
+    if args.hash_embedding:
+        from synthetic_corpus import HashingEmbedder
+        embedding_model = HashingEmbedder(dim=args.hash_embedding)
+        embedding_dim = args.hash_embedding
+
+    vector_db = MedicalVectorDB(data_dir=args.data_dir, embedding_model=embedding_model,
+                                embedding_dim=embedding_dim, mmap_index=not args.no_mmap)
+    service = SearchService(vector_db, max_batch=args.max_batch, max_wait_ms=args.max_wait_ms,
+                            workers=args.workers)
+    try:
+        asyncio.run(service.serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
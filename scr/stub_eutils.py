@@ -0,0 +1,149 @@
+"""
+本地模拟E-utilities服务
+
+用合成语料模拟 esearch/efetch，支持 term 关键词匹配、datetype/mindate/maxdate、
+retmax/retstart 和逗号分隔的多个id，并统计各接口的请求次数，
+用于离线测试订阅的增量同步等功能。
+
+用法:
+    python stub_eutils.py --count 1000 --port 8765
+    EUTILS_BASE_URL=http://127.0.0.1:8765 python subscriptions.py sync
+"""
+import argparse
+import re
+import threading
+from datetime import date, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from synthetic_corpus import efetch_xml, esearch_xml, generate_records
+
+DATE_FORMAT = "%Y/%m/%d"
+
+
+class StubEutils:
+    """模拟的E-utilities服务
+
+    每条记录带有 'edat'（收录日期，YYYY/MM/DD）；add_records 可以模拟新论文上线。
+    """
+
+    def __init__(self, records=(), host="127.0.0.1", port=0):
+        self.records = {}
+        self.requests = {"esearch": 0, "efetch": 0, "efetch_ids": 0}
+        self.fail_endpoints = set()  # 模拟上游故障，其中的接口返回HTTP 500
+        self.fail_pmids = set()  # 请求中包含这些PMID时 efetch 返回HTTP 500
+        self._lock = threading.Lock()
+        self.add_records(records)
+        self.server = ThreadingHTTPServer((host, port), self._handler())
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def add_records(self, records, edat=None):
+        """添加记录，未指定收录日期时使用edat参数或今天"""
+        default = (edat or date.today()).strftime(DATE_FORMAT)
+        with self._lock:
+            for record in records:
+                record = dict(record)
+                record.setdefault("edat", default)
+                self.records[str(record["pmid"])] = record
+
+    def start(self):
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def esearch(self, params):
+        term = params.get("term", [""])[0]
+        # 去掉 "AND 30[pdat]" 之类的限定，只按关键词匹配
+        words = [w.lower() for w in re.sub(r"\bAND\s+\S+\[\w+\]", " ", term).split() if w.upper() != "AND"]
+        mindate = params.get("mindate", [None])[0]
+        maxdate = params.get("maxdate", [None])[0]
+        retmax = int(params.get("retmax", ["20"])[0])
+        retstart = int(params.get("retstart", ["0"])[0])
+
+        with self._lock:
+            records = list(self.records.values())
+        matches = []
+        for record in records:
+            text = f"{record['title']} {record['abstract']}".lower()
+            if not all(w in text for w in words):
+                continue
+            # YYYY/MM/DD 可以直接按字符串比较
+            if mindate and record["edat"] < mindate:
+                continue
+            if maxdate and record["edat"] > maxdate:
+                continue
+            matches.append(record)
+        matches.sort(key=lambda r: (r["edat"], r["pmid"]), reverse=True)
+        return esearch_xml([r["pmid"] for r in matches[retstart:retstart + retmax]])
+
+    def efetch(self, params):
+        ids = [i for i in params.get("id", [""])[0].split(",") if i]
+        with self._lock:
+            self.requests["efetch_ids"] += len(ids)
+            records = [self.records[i] for i in ids if i in self.records]
+        return efetch_xml(records)
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                url = urlparse(self.path)
+                params = parse_qs(url.query)
+                endpoint = url.path.rstrip("/").rsplit("/", 1)[-1].replace(".fcgi", "")
+                if endpoint not in ("esearch", "efetch"):
+                    self.send_error(404)
+                    return
+                with stub._lock:
+                    stub.requests[endpoint] += 1
+                ids = set(params.get("id", [""])[0].split(","))
+                if endpoint in stub.fail_endpoints or (endpoint == "efetch" and ids & stub.fail_pmids):
+                    self.send_error(500)
+                    return
+                body = stub.esearch(params) if endpoint == "esearch" else stub.efetch(params)
+                self.send_response(200)
+                self.send_header("Content-Type", "text/xml; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local stub of the PubMed E-utilities API")
+    parser.add_argument("--count", type=int, default=1000, help="合成论文数量")
+    parser.add_argument("--days", type=int, default=60, help="收录日期分布在最近多少天内")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    today = date.today()
+    records = []
+    for i, record in enumerate(generate_records(args.count, seed=args.seed)):
+        record["edat"] = (today - timedelta(days=i % max(args.days, 1))).strftime(DATE_FORMAT)
+        records.append(record)
+
+    stub = StubEutils(records, host=args.host, port=args.port)
+    print(f"Serving {len(records)} synthetic records at {stub.base_url}")
+    try:
+        stub.server.serve_forever()
+    except KeyboardInterrupt:
+        stub.server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,330 @@
+"""
+检索订阅与增量同步
+
+保存常用的检索式，每个订阅记录高水位（上次同步日期和该时间窗口内已见过的PMID）。
+同步时只按收录日期（mindate/maxdate）检索新论文，跳过已见过或已入库的PMID，
+所有订阅的新论文合并后一次入库，因此保持N个主题最新的开销只与新论文数量成正比。
+
+用法:
+    python subscriptions.py add "COVID-19 vaccine" --days 30
+    python subscriptions.py list
+    python subscriptions.py sync
+    python subscriptions.py run --interval 3600
+"""
+import argparse
+import json
+import os
+import threading
+import time
+from datetime import date, datetime, timedelta
+
+from pubmed_api import fetch_pubmed_details, search_pubmed_ids
+from tracing import span
+
+DATE_FORMAT = "%Y/%m/%d"
+# 同一PMID获取详情连续失败这么多次后不再重试（撤稿、efetch出错或XML无法解析）
+MAX_FETCH_ATTEMPTS = 3
+# esearch 单页最多返回10000条；NCBI 对无API key的请求限制为每秒3次
+ESEARCH_PAGE_SIZE = 10000
+ESEARCH_INTERVAL = 0.34
+
+
+class SubscriptionStore:
+    """订阅的持久化存储（JSON文件）"""
+
+    def __init__(self, data_dir='../data'):
+        self.path = os.path.join(data_dir, 'subscriptions.json')
+        self.subscriptions = {}
+        self._lock = threading.RLock()
+        os.makedirs(data_dir, exist_ok=True)
+        self.load()
+
+    def load(self):
+        """从文件加载订阅"""
+        if not os.path.exists(self.path):
+            return False
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                self.subscriptions = json.load(f)
+            return True
+        except Exception as e:
+            print(f"Error loading subscriptions: {e}")
+            return False
+
+    def save(self):
+        """保存订阅（先写临时文件再替换，避免中断时损坏）"""
+        with self._lock:
+            tmp_path = self.path + '.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self.subscriptions, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_path, self.path)
+
+    def add(self, query, max_results=100, days=30, today=None):
+        """添加订阅，首次同步覆盖最近days天"""
+        today = today or date.today()
+        with self._lock:
+            if query in self.subscriptions:
+                return self.subscriptions[query]
+            subscription = {
+                "query": query,
+                "max_results": max_results,
+                "last_sync": (today - timedelta(days=days)).strftime(DATE_FORMAT),
+                "seen_pmids": [],
+                "pending_pmids": [],
+                "retry_pmids": {},
+                "parked_pmids": [],
+                "created": datetime.now().isoformat(),
+                "last_run": None,
+                "last_new": 0,
+                "total_new": 0,
+                "last_error": None,
+            }
+            self.subscriptions[query] = subscription
+            self.save()
+            return subscription
+
+    def remove(self, query):
+        """删除订阅"""
+        with self._lock:
+            if self.subscriptions.pop(query, None) is None:
+                return False
+            self.save()
+            return True
+
+    def list(self):
+        with self._lock:
+            return [dict(s) for s in self.subscriptions.values()]
+
+
+class SubscriptionSyncer:
+    """按高水位增量同步订阅，并将新论文批量入库
+
+    ingest: 入库函数，接收论文列表，默认 vector_db.add_papers。
+    必须同步完成入库，失败时抛出异常或返回False；订阅的新高水位只在入库成功后才写入
+    page_size / request_interval: esearch 每页条数和翻页之间的等待秒数
+    """
+
+    def __init__(self, store, vector_db, ingest=None, page_size=ESEARCH_PAGE_SIZE,
+                 request_interval=ESEARCH_INTERVAL):
+        self.store = store
+        self.vector_db = vector_db
+        self.ingest = ingest or vector_db.add_papers
+        self.page_size = page_size
+        self.request_interval = request_interval
+        self._sync_lock = threading.Lock()
+
+    def _known_pmids(self):
+        """向量数据库中已有的PMID（包括已归并的近似重复论文）"""
+        return set(self.vector_db.known_pmids())
+
+    def _window_ids(self, subscription, maxdate):
+        """分页获取高水位之后收录的全部PMID，esearch出错时抛出RuntimeError
+
+        esearch按日期倒序返回，只取前max_results个会漏掉窗口内较早的论文，
+        因此这里取完整个窗口，每次获取详情的数量由 sync_one 限制。
+        翻页之间等待 request_interval 秒，不超过NCBI的请求频率限制。
+        """
+        ids = []
+        retstart = 0
+        while True:
+            if retstart and self.request_interval:
+                time.sleep(self.request_interval)
+            page = search_pubmed_ids(subscription["query"], max_results=self.page_size,
+                                     mindate=subscription["last_sync"], maxdate=maxdate,
+                                     datetype="edat", retstart=retstart)
+            if page is None:
+                raise RuntimeError(f"esearch failed for '{subscription['query']}' "
+                                   f"(retstart={retstart})")
+            ids.extend(page)
+            if len(page) < self.page_size:
+                break
+            retstart += self.page_size
+        return list(dict.fromkeys(ids))
+
+    def sync_one(self, subscription, known=None, today=None):
+        """同步单个订阅，返回 (新论文列表, 新的订阅状态)
+
+        不修改传入的订阅，论文入库成功后再由调用方写入新状态。
+
+        下次同步从本次的maxdate（含当天）开始，当天重叠的部分由 seen_pmids 去重，
+        因此 seen_pmids 只需保存最近一个时间窗口内的PMID。
+        每次最多获取 max_results 篇，按以下顺序排队：上次超出上限的 pending_pmids、
+        本次窗口中的新PMID、获取失败待重试的 retry_pmids（PMID -> 失败次数）。
+        连续失败 MAX_FETCH_ATTEMPTS 次的PMID移入 parked_pmids，不再自动重试，
+        避免无法获取的PMID一直占用每批的名额。esearch出错时抛出异常，订阅状态保持不变。
+        """
+        maxdate = (today or date.today()).strftime(DATE_FORMAT)
+        known = self._known_pmids() if known is None else known
+
+        with span("subscriptions.sync_one", query=subscription["query"],
+                  mindate=subscription["last_sync"]) as s:
+            window_ids = self._window_ids(subscription, maxdate)
+            seen = set(subscription["seen_pmids"]) | known
+            retries = {pmid: attempts for pmid, attempts in subscription.get("retry_pmids", {}).items()
+                       if pmid not in known}
+            # 重试的PMID排在未尝试过的PMID之后
+            queue = list(dict.fromkeys(
+                [pmid for pmid in subscription.get("pending_pmids", []) if pmid not in retries] +
+                [pmid for pmid in window_ids if pmid not in seen and pmid not in retries] +
+                list(retries)))
+            queue = [pmid for pmid in queue if pmid not in known]
+            batch_ids = queue[:subscription["max_results"]]
+
+            papers = fetch_pubmed_details(batch_ids) if batch_ids else []
+            fetched = {str(p['pmid']) for p in papers}
+
+            parked = list(subscription.get("parked_pmids", []))
+            for pmid in batch_ids:
+                if pmid in fetched:
+                    retries.pop(pmid, None)
+                    continue
+                retries[pmid] = retries.get(pmid, 0) + 1
+                if retries[pmid] >= MAX_FETCH_ATTEMPTS:
+                    print(f"Giving up on PMID {pmid} after {retries.pop(pmid)} failed fetches.")
+                    parked.append(pmid)
+            pending = [pmid for pmid in queue[len(batch_ids):] if pmid not in retries]
+            s.set("window", len(window_ids))
+            s.set("new", len(papers))
+            s.set("pending", len(pending))
+            s.set("retry", len(retries))
+
+        state = {
+            "seen_pmids": window_ids,
+            "pending_pmids": pending,
+            "retry_pmids": retries,
+            "parked_pmids": parked,
+            "last_sync": maxdate,
+            "last_run": datetime.now().isoformat(),
+            "last_new": len(papers),
+            "total_new": subscription.get("total_new", 0) + len(papers),
+            "last_error": None,
+        }
+        return papers, state
+
+    def sync_all(self, today=None):
+        """同步所有订阅，新论文合并后一次入库，返回 {检索式: 新论文数}
+
+        单个订阅检索失败时记录在其 last_error 中并跳过（不计入返回结果），不影响其他订阅。
+        入库失败时抛出异常，所有订阅保持原来的高水位，下次同步重新获取。
+        """
+        with self._sync_lock:
+            known = self._known_pmids()
+            all_papers = []
+            summary = {}
+            states = {}
+            # 使用订阅的副本，入库成功前不修改 store 中的订阅（期间其他线程可能调用 store.save）
+            for subscription in self.store.list():
+                query = subscription["query"]
+                try:
+                    papers, states[query] = self.sync_one(subscription, known=known, today=today)
+                except Exception as e:
+                    print(f"Error syncing subscription '{query}': {e}")
+                    with self.store._lock:
+                        if query in self.store.subscriptions:
+                            self.store.subscriptions[query]["last_error"] = str(e)
+                    continue
+                # 不同订阅可能命中同一篇论文
+                papers = [p for p in papers if str(p['pmid']) not in known]
+                known.update(str(p['pmid']) for p in papers)
+                all_papers.extend(papers)
+                summary[query] = len(papers)
+
+            if all_papers:
+                with span("subscriptions.ingest", count=len(all_papers)):
+                    if self.ingest(all_papers) is False:
+                        raise RuntimeError(f"Failed to ingest {len(all_papers)} subscription papers")
+
+            with self.store._lock:
+                for query, state in states.items():
+                    # 同步期间被取消的订阅不再写回
+                    if query in self.store.subscriptions:
+                        self.store.subscriptions[query].update(state)
+                self.store.save()
+            print(f"Synced {len(summary)} subscriptions, {len(all_papers)} new papers.")
+            return summary
+
+
+class SubscriptionScheduler:
+    """定时同步订阅的后台线程"""
+
+    def __init__(self, syncer, interval=3600):
+        self.syncer = syncer
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = None
+        self.last_summary = None
+        self.last_error = None
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="subscription-sync", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.last_summary = self.syncer.sync_all()
+                self.last_error = None
+            except Exception as e:
+                print(f"Error syncing subscriptions: {e}")
+                self.last_error = str(e)
+            self._stop.wait(self.interval)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage and sync saved PubMed query subscriptions")
+    parser.add_argument("--data-dir", default="../data", help="数据目录")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    add_parser = subparsers.add_parser("add", help="添加订阅")
+    add_parser.add_argument("query")
+    add_parser.add_argument("--days", type=int, default=30, help="首次同步覆盖的天数")
+    add_parser.add_argument("--max-results", type=int, default=100, help="每次同步的最大论文数")
+
+    remove_parser = subparsers.add_parser("remove", help="删除订阅")
+    remove_parser.add_argument("query")
+
+    subparsers.add_parser("list", help="列出订阅")
+    subparsers.add_parser("sync", help="立即同步所有订阅")
+
+    run_parser = subparsers.add_parser("run", help="定时同步")
+    run_parser.add_argument("--interval", type=int, default=3600, help="同步间隔（秒）")
+
+    args = parser.parse_args()
+    store = SubscriptionStore(args.data_dir)
+
+    if args.command == "add":
+        subscription = store.add(args.query, max_results=args.max_results, days=args.days)
+        print(f"Subscribed to '{args.query}' (since {subscription['last_sync']})")
+    elif args.command == "remove":
+        print("Removed." if store.remove(args.query) else "No such subscription.")
+    elif args.command == "list":
+        for s in store.list():
+            print(f"{s['query']}: last sync {s['last_sync']}, last new {s['last_new']}, "
+                  f"total new {s['total_new']}, pending {len(s.get('pending_pmids', []))}, "
+                  f"retrying {len(s.get('retry_pmids', {}))}, parked {len(s.get('parked_pmids', []))}")
+            if s.get('last_error'):
+                print(f"  last error: {s['last_error']}")
+    else:
+        # 仅同步时才需要加载向量数据库和模型
+        from vector_db import MedicalVectorDB
+        syncer = SubscriptionSyncer(store, MedicalVectorDB(data_dir=args.data_dir))
+        if args.command == "sync":
+            print(json.dumps(syncer.sync_all(), ensure_ascii=False, indent=2))
+        else:
+            scheduler = SubscriptionScheduler(syncer, interval=args.interval)
+            try:
+                scheduler._run()
+            except KeyboardInterrupt:
+                pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,220 @@
+"""
+合成PubMed语料生成器
+
+生成与 pubmed_api 输出格式一致的论文记录，以及对应的efetch XML，
+并提供一个确定性的哈希向量模型，用于在无网络、无预训练模型的环境下做基准测试。
+
+用法:
+    python synthetic_corpus.py --count 1000 --output corpus.jsonl --xml-output corpus.xml
+"""
+import argparse
+import json
+import random
+import zlib
+from xml.sax.saxutils import escape
+
+import numpy as np
+
+TOPICS = [
+    "diabetes", "hypertension", "COVID-19", "influenza", "asthma", "heart failure",
+    "stroke", "breast cancer", "lung cancer", "depression", "Alzheimer disease",
+    "chronic kidney disease", "sepsis", "obesity", "atrial fibrillation", "tuberculosis",
+    "HIV", "rheumatoid arthritis", "osteoporosis", "migraine",
+]
+INTERVENTIONS = [
+    "metformin", "SGLT2 inhibitors", "statin therapy", "mRNA vaccination", "exercise training",
+    "cognitive behavioral therapy", "immunotherapy", "anticoagulation", "dietary intervention",
+    "telemedicine follow-up", "beta blockers", "corticosteroids", "antiviral treatment",
+]
+DESIGNS = [
+    "A randomized controlled trial", "A prospective cohort study", "A systematic review and meta-analysis",
+    "A retrospective cohort study", "A cross-sectional study", "A multicenter observational study",
+]
+OUTCOMES = [
+    "all-cause mortality", "hospital readmission", "quality of life", "glycemic control",
+    "blood pressure", "major adverse cardiovascular events", "symptom severity", "adverse events",
+]
+FILLER = [
+    "patients", "treatment", "outcomes", "significant", "reduction", "risk", "cohort", "follow-up",
+    "analysis", "baseline", "compared", "associated", "clinical", "efficacy", "safety", "months",
+    "participants", "intervention", "control", "increase", "evidence", "primary", "secondary",
+]
+LAST_NAMES = [
+    "Smith", "Johnson", "Wang", "Li", "Zhang", "Garcia", "Müller", "Kim", "Nguyen", "Brown",
+    "Rossi", "Tanaka", "Chen", "Silva", "Patel", "Martin", "Liu", "Lee", "Kowalski", "Andersen",
+]
+FORE_NAMES = [
+    "John", "Wei", "Maria", "Anna", "Hiroshi", "Li", "David", "Sofia", "Raj", "Elena",
+    "James", "Min", "Lucas", "Fatima", "Peter", "Yan", "Olga", "Carlos", "Emma", "Ahmed",
+]
+JOURNAL_WORDS = [
+    "Journal", "Clinical", "Medicine", "Research", "International", "Cardiology", "Oncology",
+    "Endocrinology", "Infectious Diseases", "Public Health", "Neurology", "Pediatrics",
+]
+MONTHS = ["Jan", "Feb", "Mar", "Apr", "May", "Jun", "Jul", "Aug", "Sep", "Oct", "Nov", "Dec"]
+
+
+def _journals(rng, count=200):
+    names = set()
+    while len(names) < count:
+        names.add(" ".join(rng.sample(JOURNAL_WORDS, rng.randint(2, 4))))
+    return sorted(names)
+
+
+def generate_records(count, seed=42, start_pmid=30000000):
+    """逐条生成合成论文记录（生成器，避免大规模时一次性占用内存）"""
+    rng = random.Random(seed)
+    journals = _journals(rng)
+    for i in range(count):
+        topic = rng.choice(TOPICS)
+        intervention = rng.choice(INTERVENTIONS)
+        outcome = rng.choice(OUTCOMES)
+        title = f"Effect of {intervention} on {outcome} in patients with {topic}"
+        sentences = [
+            f"{rng.choice(DESIGNS)} of {rng.randint(50, 20000)} patients with {topic}.",
+            f"We evaluated whether {intervention} improves {outcome}.",
+        ]
+        sentences += [" ".join(rng.choices(FILLER, k=rng.randint(12, 25))) + "." for _ in range(rng.randint(4, 8))]
+        authors = [f"{rng.choice(FORE_NAMES)} {rng.choice(LAST_NAMES)}" for _ in range(rng.randint(1, 8))]
+        record = {
+            "pmid": str(start_pmid + i),
+            "title": title,
+            "abstract": " ".join(sentences),
+            "authors": ", ".join(authors),
+            "source": rng.choice(journals),
+            "pub_date": f"{rng.randint(2015, 2024)}-{rng.choice(MONTHS)}-{rng.randint(1, 28)}",
+        }
+        if rng.random() < 0.8:
+            record["doi"] = f"10.{rng.randint(1000, 9999)}/syn.{start_pmid + i}"
+        yield record
+
+
+DUPLICATE_KINDS = [
+    ("Erratum: ", None),
+    ("Correction to: ", None),
+    ("", "medRxiv"),  # 预印本
+    ("", None),       # 转载
+]
+
+
+def inject_near_duplicates(records, rate=0.1, seed=7, start_pmid=80000000):
+    """在记录中混入近似重复论文（勘误、更正、预印本、转载）
+
+    每条重复记录有新的PMID，标题加前缀或期刊不同，摘要有少量改动。
+    返回新列表，重复记录紧跟在原记录后面，便于模拟真实的入库顺序。
+    """
+    rng = random.Random(seed)
+    output = []
+    next_pmid = start_pmid
+    for record in records:
+        output.append(record)
+        if rng.random() >= rate:
+            continue
+        prefix, source = rng.choice(DUPLICATE_KINDS)
+        words = record["abstract"].split()
+        # 随机替换少量词
+        for _ in range(max(1, len(words) // 50)):
+            words[rng.randrange(len(words))] = rng.choice(FILLER)
+        duplicate = dict(record)
+        duplicate.pop("doi", None)
+        duplicate.update({
+            "pmid": str(next_pmid),
+            "title": prefix + record["title"],
+            "abstract": " ".join(words),
+            "source": source or record["source"],
+        })
+        next_pmid += 1
+        output.append(duplicate)
+    return output
+
+
+def record_to_xml(record):
+    """将一条记录转换为efetch返回的PubmedArticle XML片段"""
+    year, month, day = record["pub_date"].split("-")
+    authors = []
+    for name in record["authors"].split(", "):
+        fore, _, last = name.rpartition(" ")
+        authors.append(
+            f"<Author><LastName>{escape(last)}</LastName><ForeName>{escape(fore)}</ForeName></Author>"
+        )
+    doi = ""
+    if "doi" in record:
+        doi = f'<ArticleId IdType="doi">{escape(record["doi"])}</ArticleId>'
+    return (
+        "<PubmedArticle><MedlineCitation><PMID>{pmid}</PMID><Article>"
+        "<Journal><JournalIssue><PubDate><Year>{year}</Year><Month>{month}</Month><Day>{day}</Day>"
+        "</PubDate></JournalIssue><Title>{journal}</Title></Journal>"
+        "<ArticleTitle>{title}</ArticleTitle>"
+        "<Abstract><AbstractText>{abstract}</AbstractText></Abstract>"
+        "<AuthorList>{authors}</AuthorList></Article></MedlineCitation>"
+        '<PubmedData><ArticleIdList><ArticleId IdType="pubmed">{pmid}</ArticleId>{doi}</ArticleIdList>'
+        "</PubmedData></PubmedArticle>"
+    ).format(
+        pmid=record["pmid"], year=year, month=month, day=day,
+        journal=escape(record["source"]), title=escape(record["title"]),
+        abstract=escape(record["abstract"]), authors="".join(authors), doi=doi,
+    )
+
+
+def efetch_xml(records):
+    """生成efetch响应（PubmedArticleSet），可包含一篇或多篇论文"""
+    body = "".join(record_to_xml(r) for r in records)
+    return f'<?xml version="1.0" ?>\n<PubmedArticleSet>{body}</PubmedArticleSet>'.encode("utf-8")
+
+
+def esearch_xml(pmids):
+    """生成esearch响应"""
+    ids = "".join(f"<Id>{pmid}</Id>" for pmid in pmids)
+    return (
+        f'<?xml version="1.0" ?>\n<eSearchResult><Count>{len(pmids)}</Count>'
+        f"<RetMax>{len(pmids)}</RetMax><IdList>{ids}</IdList></eSearchResult>"
+    ).encode("utf-8")
+
+
+class HashingEmbedder:
+    """确定性的哈希词袋向量模型，接口与 SentenceTransformer.encode 兼容
+
+    不需要下载模型，速度快，相同文本总是得到相同向量，适合离线基准测试。
+    """
+
+    def __init__(self, dim=768):
+        self.dim = dim
+
+    def _encode_one(self, text):
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for token in text.lower().split():
+            h = zlib.crc32(token.encode("utf-8"))
+            vector[h % self.dim] += 1.0 if (h >> 31) & 1 else -1.0
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm > 0 else vector
+
+    def encode(self, text, convert_to_numpy=True, **kwargs):
+        if isinstance(text, str):
+            return self._encode_one(text)
+        return np.vstack([self._encode_one(t) for t in text]) if text else np.zeros((0, self.dim), dtype=np.float32)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a synthetic PubMed-like corpus")
+    parser.add_argument("--count", type=int, default=1000, help="论文数量")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", default="corpus.jsonl", help="记录输出文件 (JSON Lines)")
+    parser.add_argument("--xml-output", default=None, help="可选，efetch XML输出文件")
+    args = parser.parse_args()
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        for record in generate_records(args.count, seed=args.seed):
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+    print(f"Wrote {args.count} records to {args.output}")
+
+    if args.xml_output:
+        with open(args.xml_output, "w", encoding="utf-8") as f:
+            f.write('<?xml version="1.0" ?>\n<PubmedArticleSet>')
+            for record in generate_records(args.count, seed=args.seed):
+                f.write(record_to_xml(record))
+            f.write("</PubmedArticleSet>")
+        print(f"Wrote efetch XML to {args.xml_output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+"""
+轻量级阶段计时追踪
+
+在各模块中用 span() 记录带属性的计时区间，保存在进程内的环形缓冲区中，
+可以计算各阶段滚动的 p50/p95，也可以导出为JSON Lines离线分析。
+环境变量 MEDICAL_TRACING=0 关闭追踪，此时 span() 返回共享的空操作对象。
+"""
+import json
+import math
+import os
+import threading
+import time
+from collections import deque
+
+_enabled = os.environ.get("MEDICAL_TRACING", "1") != "0"
+_buffer = deque(maxlen=int(os.environ.get("MEDICAL_TRACING_BUFFER", "5000")))
+_lock = threading.Lock()
+_local = threading.local()
+
+
+class Span:
+    """一次计时记录"""
+
+    __slots__ = ("name", "attrs", "start", "duration", "parent", "error", "thread", "_t0")
+
+    def __init__(self, name, attrs):
+        self.name = name
+        self.attrs = attrs
+        self.start = None
+        self.duration = None
+        self.parent = None
+        self.error = None
+        self.thread = None
+        self._t0 = None
+
+    def set(self, key, value):
+        """记录属性，如数量、字节数、缓存命中"""
+        self.attrs[key] = value
+
+    def __enter__(self):
+        stack = getattr(_local, "stack", None)
+        if stack is None:
+            stack = _local.stack = []
+        self.parent = stack[-1].name if stack else None
+        stack.append(self)
+        self.thread = threading.current_thread().name
+        self.start = time.time()
+        self._t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.duration = time.perf_counter() - self._t0
+        if exc_type is not None:
+            self.error = exc_type.__name__
+        _local.stack.pop()
+        with _lock:
+            _buffer.append(self)
+        return False
+
+    def to_dict(self):
+        return {
+            "name": self.name,
+            "start": self.start,
+            "duration_ms": round(self.duration * 1000, 3),
+            "parent": self.parent,
+            "error": self.error,
+            "thread": self.thread,
+            "attrs": self.attrs,
+        }
+
+
+class _NoopSpan:
+    """追踪关闭时使用的空操作span"""
+
+    __slots__ = ()
+
+    def set(self, key, value):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NOOP = _NoopSpan()
+
+
+def span(name, **attrs):
+    """创建计时span，用法: with span("vector_db.search", k=5) as s: ..."""
+    if not _enabled:
+        return _NOOP
+    return Span(name, attrs)
+
+
+def is_enabled():
+    return _enabled
+
+
+def set_enabled(enabled):
+    """开启或关闭追踪"""
+    global _enabled
+    _enabled = bool(enabled)
+
+
+def get_spans(name=None):
+    """获取缓冲区中的span（按完成时间排序）"""
+    with _lock:
+        spans = list(_buffer)
+    if name is not None:
+        spans = [s for s in spans if s.name == name]
+    return spans
+
+
+def clear():
+    """清空缓冲区"""
+    with _lock:
+        _buffer.clear()
+
+
+def percentile(values, p):
+    """计算百分位数（最近秩法，取第 ceil(p/100*n) 个值）"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(math.ceil(p / 100 * len(ordered)) - 1, 0)
+    return ordered[min(rank, len(ordered) - 1)]
+
+
+def stage_stats():
+    """按阶段统计缓冲区内的调用次数、错误数和 p50/p95 延迟（毫秒）"""
+    durations = {}
+    errors = {}
+    for s in get_spans():
+        durations.setdefault(s.name, []).append(s.duration * 1000)
+        if s.error:
+            errors[s.name] = errors.get(s.name, 0) + 1
+
+    stats = []
+    for name, values in sorted(durations.items()):
+        values.sort()
+        stats.append({
+            "stage": name,
+            "count": len(values),
+            "errors": errors.get(name, 0),
+            "p50_ms": round(percentile(values, 50), 3),
+            "p95_ms": round(percentile(values, 95), 3),
+            "max_ms": round(values[-1], 3),
+        })
+    return stats
+
+
+def export_jsonl(path=None):
+    """导出span为JSON Lines，指定path时写入文件并返回条数，否则返回字符串"""
+    lines = [json.dumps(s.to_dict(), ensure_ascii=False, default=str) for s in get_spans()]
+    text = "\n".join(lines) + ("\n" if lines else "")
+    if path is None:
+        return text
+    with open(path, 'a', encoding='utf-8') as f:
+        f.write(text)
+    return len(lines)
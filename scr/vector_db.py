@@ -3,21 +3,48 @@ import numpy as np
 import os
 import pickle
 import json
-from sentence_transformers import SentenceTransformer
+import threading
 from datetime import datetime
+from tracing import span
 
 # 使用适合医学文本的模型
-model = SentenceTransformer('pritamdeka/S-PubMedBert-MS-MARCO')
+MODEL_NAME = 'pritamdeka/S-PubMedBert-MS-MARCO'
+_model = None
+_model_lock = threading.Lock()
+
+def get_model():
+    """首次使用时加载句向量模型，避免导入模块时就下载模型"""
+    global _model
+    with _model_lock:
+        if _model is None:
+            from sentence_transformers import SentenceTransformer
+            _model = SentenceTransformer(MODEL_NAME)
+    return _model
 
 class MedicalVectorDB:
     """医学论文向量数据库"""
     
-    def __init__(self, data_dir='../data'):
-        """初始化向量数据库"""
+    def __init__(self, data_dir='../data', embedding_model=None, embedding_dim=768,
+                 near_duplicate_threshold=None, mmap_index=False):
+        """初始化向量数据库
+        
+        embedding_model: 可选，任何提供 encode(text, convert_to_numpy=True) 的模型，
+        默认使用PubMedBERT；离线测试时可传入轻量的替代模型
+        near_duplicate_threshold: 可选，余弦相似度阈值（如0.95）。设置后入库时会检测
+        预印本、勘误、转载等近似重复论文，将其归并到已有的规范记录下，不再单独索引
+        mmap_index: 以内存映射方式使用保存的FAISS索引文件，多个进程可共享同一份索引页；
+        此时论文的向量只保存在索引文件中，不再在内存中另存一份
+        """
         self.data_dir = data_dir
         self.papers = []
         self.index = None
-        self.embedding_dim = 768  # PubMedBERT的维度
+        self.near_duplicate_threshold = near_duplicate_threshold
+        self.cosine_index = None  # 归一化向量的内积索引，用于近似重复检测
+        self.mmap_index = mmap_index
+        self.embedding_model = embedding_model
+        self.embedding_dim = embedding_dim  # PubMedBERT的维度为768
+        # 后台入库线程与前台检索共用实例，写操作需要加锁
+        self._lock = threading.RLock()
         
         # 创建数据目录（如果不存在）
         os.makedirs(data_dir, exist_ok=True)
@@ -30,37 +57,63 @@ class MedicalVectorDB:
         if not text or text.strip() == "":
             # 处理空文本
             return np.zeros(self.embedding_dim)
-        return model.encode(text, convert_to_numpy=True)
+        return (self.embedding_model or get_model()).encode(text, convert_to_numpy=True)
     
     def add_papers(self, new_papers):
-        """添加新论文到数据库"""
-        if not new_papers:
-            return False
-        
-        # 检查是否有重复论文（通过PMID）
-        existing_pmids = {paper.get('pmid') for paper in self.papers if 'pmid' in paper}
-        unique_papers = [p for p in new_papers if p.get('pmid') not in existing_pmids]
-        
-        if not unique_papers:
-            print("No new unique papers to add.")
-            return False
+        """添加新论文到数据库
         
-        print(f"Adding {len(unique_papers)} new papers to the database.")
-        
-        # 为每篇论文生成向量
-        for paper in unique_papers:
-            # 组合标题和摘要以获得更好的表示
-            text_for_embedding = f"{paper.get('title', '')} {paper.get('abstract', '')}"
-            paper['embedding'] = self.get_embedding(text_for_embedding).tolist()
-            paper['added_date'] = datetime.now().isoformat()
-            self.papers.append(paper)
-        
-        # 重建索引
-        self._build_index()
+        返回新加入的论文数（包括归并为近似重复的论文），没有新论文时返回0；
+        保存到磁盘失败时抛出 OSError
+        """
+        if not new_papers:
+            return 0
         
-        # 保存更新后的数据库
-        self.save_database()
-        return True
+        with self._lock:
+            # 检查是否有重复论文（通过PMID），同一批次内的重复也会被跳过
+            existing_pmids = {paper.get('pmid') for paper in self.papers if 'pmid' in paper}
+            for paper in self.papers:
+                existing_pmids.update(d.get('pmid') for d in paper.get('duplicates', []))
+            unique_papers = []
+            for p in new_papers:
+                pmid = p.get('pmid')
+                if pmid in existing_pmids:
+                    continue
+                if pmid is not None:
+                    existing_pmids.add(pmid)
+                unique_papers.append(p)
+            
+            if not unique_papers:
+                print("No new unique papers to add.")
+                return 0
+            
+            added = len(unique_papers)
+            print(f"Adding {added} new papers to the database.")
+            
+            # 为每篇论文生成向量
+            with span("vector_db.embed", count=len(unique_papers),
+                      skipped=len(new_papers) - len(unique_papers)):
+                for paper in unique_papers:
+                    # 组合标题和摘要以获得更好的表示
+                    text_for_embedding = f"{paper.get('title', '')} {paper.get('abstract', '')}"
+                    paper['embedding'] = self.get_embedding(text_for_embedding).tolist()
+                    paper['added_date'] = datetime.now().isoformat()
+            
+            # 近似重复的论文归并到规范记录下，只索引规范记录
+            if self.near_duplicate_threshold is not None:
+                unique_papers = self._merge_near_duplicates(unique_papers)
+            
+            if unique_papers:
+                self.papers.extend(unique_papers)
+                
+                # 重建索引
+                self._build_index()
+            
+            # 保存更新后的数据库，内存映射模式下换回新写入的索引文件
+            if not self.save_database():
+                raise OSError(f"Failed to save database to {self.data_dir}")
+            if self.mmap_index:
+                self._use_mmap_index()
+            return added
     
     def _build_index(self):
         """构建FAISS索引"""
@@ -68,39 +121,155 @@ class MedicalVectorDB:
             print("No papers to index.")
             return
         
-        # 提取所有论文的向量
-        embeddings = [np.array(paper['embedding'], dtype=np.float32) for paper in self.papers]
-        embeddings_matrix = np.vstack(embeddings)
-        
-        # 创建索引
-        self.index = faiss.IndexFlatL2(self.embedding_dim)
-        self.index.add(embeddings_matrix)
+        with span("vector_db.build_index", count=len(self.papers)):
+            # 提取所有论文的向量
+            embeddings_matrix = self._paper_vectors()
+            
+            # 在局部变量中建好索引再一次性替换，并发检索不会看到空的或未建完的索引
+            index = faiss.IndexFlatL2(self.embedding_dim)
+            index.add(embeddings_matrix)
+            
+            if self.near_duplicate_threshold is not None:
+                cosine_index = faiss.IndexFlatIP(self.embedding_dim)
+                cosine_index.add(self._normalize(embeddings_matrix))
+                self.cosine_index = cosine_index
+            self.index = index
         print(f"Built index with {len(self.papers)} papers.")
     
+    def _paper_vectors(self):
+        """返回所有论文的向量矩阵，内存中没有向量的论文从当前索引中读取"""
+        matrix = np.zeros((len(self.papers), self.embedding_dim), dtype=np.float32)
+        missing = []
+        for i, paper in enumerate(self.papers):
+            if 'embedding' in paper:
+                matrix[i] = paper['embedding']
+            else:
+                missing.append(i)
+        if missing:
+            matrix[missing] = self.index.reconstruct_batch(np.array(missing, dtype=np.int64))
+        return matrix
+    
+    @staticmethod
+    def _normalize(matrix):
+        """按行L2归一化，使内积等于余弦相似度"""
+        matrix = np.array(matrix, dtype=np.float32)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return matrix / norms
+    
+    def _merge_near_duplicates(self, papers):
+        """检测近似重复论文，返回需要单独索引的论文
+        
+        先对已有索引做一次批量 range_search，再在新论文之间互相检测；
+        重复论文以摘要信息的形式记录在规范记录的 'duplicates' 中
+        """
+        threshold = self.near_duplicate_threshold
+        vectors = self._normalize([paper['embedding'] for paper in papers])
+        canonical_for = {}  # 新论文位置 -> (规范记录, 相似度)
+        
+        with span("vector_db.near_duplicate_check", count=len(papers),
+                  index_size=len(self.papers)) as s:
+            # 与已有论文比较
+            if self.cosine_index is not None and self.cosine_index.ntotal:
+                lims, scores, ids = self.cosine_index.range_search(vectors, threshold)
+                for i in range(len(papers)):
+                    start, end = lims[i], lims[i + 1]
+                    if end > start:
+                        best = start + int(np.argmax(scores[start:end]))
+                        canonical_for[i] = (self.papers[ids[best]], float(scores[best]))
+            
+            # 同一批次内互相比较，先出现的论文作为规范记录
+            batch_index = faiss.IndexFlatIP(self.embedding_dim)
+            batch_index.add(vectors)
+            lims, scores, ids = batch_index.range_search(vectors, threshold)
+            
+            kept = []
+            kept_positions = set()
+            for i, paper in enumerate(papers):
+                if i not in canonical_for:
+                    for j, score in zip(ids[lims[i]:lims[i + 1]], scores[lims[i]:lims[i + 1]]):
+                        if j < i:
+                            canonical = papers[j] if j in kept_positions else canonical_for[j][0]
+                            canonical_for[i] = (canonical, float(score))
+                            break
+                
+                if i in canonical_for:
+                    canonical, score = canonical_for[i]
+                    canonical.setdefault('duplicates', []).append({
+                        'pmid': paper.get('pmid'),
+                        'title': paper.get('title'),
+                        'source': paper.get('source'),
+                        'pub_date': paper.get('pub_date'),
+                        'doi': paper.get('doi'),
+                        'similarity': round(score, 4),
+                    })
+                else:
+                    kept.append(paper)
+                    kept_positions.add(i)
+            s.set("duplicates", len(papers) - len(kept))
+        
+        if len(kept) < len(papers):
+            print(f"Merged {len(papers) - len(kept)} near-duplicate papers into existing records.")
+        return kept
+    
+    def known_pmids(self):
+        """数据库中已有的PMID（包括已归并的近似重复论文）"""
+        known = set()
+        for paper in list(self.papers):
+            if 'pmid' in paper:
+                known.add(str(paper['pmid']))
+            known.update(str(d.get('pmid')) for d in paper.get('duplicates', []))
+        return known
+    
+    def get_embeddings(self, texts):
+        """批量计算文本的向量表示，返回 (len(texts), embedding_dim) 的float32矩阵"""
+        matrix = np.zeros((len(texts), self.embedding_dim), dtype=np.float32)
+        # 空文本保持零向量，其余文本一次性编码
+        positions = [i for i, text in enumerate(texts) if text and text.strip()]
+        if positions:
+            encoded = (self.embedding_model or get_model()).encode(
+                [texts[i] for i in positions], convert_to_numpy=True)
+            matrix[positions] = np.asarray(encoded, dtype=np.float32)
+        return matrix
+    
     def search(self, query, k=5):
         """搜索与查询最相关的论文"""
-        if not self.index or not self.papers:
-            print("Database is empty. No papers to search.")
+        return self.search_batch([query], k=k)[0]
+    
+    def search_batch(self, queries, k=5):
+        """批量搜索，一次编码所有查询并一次调用FAISS，返回与queries对应的结果列表"""
+        if not queries:
             return []
+        # 检索不持有写锁，先取一份引用，入库或清空时替换属性不影响本次检索
+        index, papers = self.index, self.papers
+        if index is None or not papers:
+            print("Database is empty. No papers to search.")
+            return [[] for _ in queries]
         
         # 计算查询的向量表示
-        query_vector = self.get_embedding(query).reshape(1, -1)
+        with span("vector_db.encode_query", count=len(queries),
+                  chars=sum(len(q or "") for q in queries)):
+            query_vectors = self.get_embeddings(queries)
         
         # 搜索最相似的向量
-        distances, indices = self.index.search(query_vector, k=min(k, len(self.papers)))
+        with span("vector_db.faiss_search", k=k, queries=len(queries), index_size=index.ntotal):
+            distances, indices = index.search(query_vectors, k=min(k, index.ntotal))
         
         # 返回结果
-        results = []
-        for i, idx in enumerate(indices[0]):
-            if idx < len(self.papers):  # 确保索引有效
-                paper = self.papers[idx].copy()
-                paper['score'] = float(distances[0][i])  # 添加相似度分数
-                # 移除embedding以减小大小
-                if 'embedding' in paper:
-                    del paper['embedding']
-                results.append(paper)
+        all_results = []
+        for row, row_indices in enumerate(indices):
+            results = []
+            for i, idx in enumerate(row_indices):
+                if 0 <= idx < len(papers):  # 确保索引有效
+                    paper = papers[idx].copy()
+                    paper['score'] = float(distances[row][i])  # 添加相似度分数
+                    # 移除embedding以减小大小
+                    if 'embedding' in paper:
+                        del paper['embedding']
+                    results.append(paper)
+            all_results.append(results)
         
-        return results
+        return all_results
     
     def filter_search(self, query, filters=None, k=5):
         """带过滤条件的搜索
@@ -110,11 +279,16 @@ class MedicalVectorDB:
         # 先获取更多结果，然后应用过滤
         initial_results = self.search(query, k=min(k*3, len(self.papers)))
         
+        return self.apply_filters(initial_results, filters, k)
+    
+    @staticmethod
+    def apply_filters(results, filters=None, k=5):
+        """对检索结果应用过滤条件，返回前k条"""
         if not filters:
-            return initial_results[:k]
+            return results[:k]
         
         filtered_results = []
-        for paper in initial_results:
+        for paper in results:
             # 应用过滤条件
             include = True
             
@@ -152,15 +326,26 @@ class MedicalVectorDB:
         try:
             # 保存论文数据（不包括索引）
             papers_file = os.path.join(self.data_dir, 'papers.json')
-            with open(papers_file, 'w', encoding='utf-8') as f:
-                # 将embedding转换为列表以便JSON序列化
-                serializable_papers = []
-                for paper in self.papers:
-                    paper_copy = paper.copy()
-                    if 'embedding' in paper_copy and not isinstance(paper_copy['embedding'], list):
-                        paper_copy['embedding'] = paper_copy['embedding'].tolist()
-                    serializable_papers.append(paper_copy)
-                json.dump(serializable_papers, f, ensure_ascii=False, indent=2)
+            with span("vector_db.save", count=len(self.papers)) as s:
+                # 内存映射模式下向量只在索引中，保存时临时读出，papers.json 始终包含完整向量
+                vectors = None
+                if self.index is not None and any('embedding' not in paper for paper in self.papers):
+                    vectors = self._paper_vectors()
+                with open(papers_file, 'w', encoding='utf-8') as f:
+                    # 将embedding转换为列表以便JSON序列化
+                    serializable_papers = []
+                    for i, paper in enumerate(self.papers):
+                        paper_copy = paper.copy()
+                        if 'embedding' not in paper_copy and vectors is not None:
+                            paper_copy['embedding'] = vectors[i].tolist()
+                        elif 'embedding' in paper_copy and not isinstance(paper_copy['embedding'], list):
+                            paper_copy['embedding'] = paper_copy['embedding'].tolist()
+                        serializable_papers.append(paper_copy)
+                    json.dump(serializable_papers, f, ensure_ascii=False, indent=2)
+                s.set("bytes", os.path.getsize(papers_file))
+            
+            if self.mmap_index:
+                self._save_index_file()
             
             print(f"Saved {len(self.papers)} papers to {papers_file}")
             return True
@@ -168,6 +353,14 @@ class MedicalVectorDB:
             print(f"Error saving database: {e}")
             return False
     
+    def _save_index_file(self):
+        """保存FAISS索引，供内存映射加载；先写临时文件再替换，已映射旧文件的进程不受影响"""
+        if self.index is None:
+            return
+        index_file = os.path.join(self.data_dir, 'index.faiss')
+        faiss.write_index(self.index, index_file + '.tmp')
+        os.replace(index_file + '.tmp', index_file)
+    
     def load_database(self):
         """从文件加载数据库"""
         papers_file = os.path.join(self.data_dir, 'papers.json')
@@ -177,16 +370,22 @@ class MedicalVectorDB:
             return False
         
         try:
-            with open(papers_file, 'r', encoding='utf-8') as f:
-                self.papers = json.load(f)
+            with span("vector_db.load", bytes=os.path.getsize(papers_file)) as s:
+                with open(papers_file, 'r', encoding='utf-8') as f:
+                    self.papers = json.load(f)
+                s.set("count", len(self.papers))
             
-            # 确保所有embedding都是numpy数组
-            for paper in self.papers:
-                if 'embedding' in paper and isinstance(paper['embedding'], list):
-                    paper['embedding'] = np.array(paper['embedding'], dtype=np.float32)
-            
-            # 重建索引
-            self._build_index()
+            # 优先使用保存的索引文件，否则重建索引
+            if not self._use_mmap_index():
+                # 确保所有embedding都是numpy数组
+                for paper in self.papers:
+                    if 'embedding' in paper and isinstance(paper['embedding'], list):
+                        paper['embedding'] = np.array(paper['embedding'], dtype=np.float32)
+                self._build_index()
+                # 索引文件缺失或过期时重新写出，之后改用内存映射
+                if self.mmap_index and self.near_duplicate_threshold is None:
+                    self._save_index_file()
+                    self._use_mmap_index()
             
             print(f"Loaded {len(self.papers)} papers from {papers_file}")
             return True
@@ -194,15 +393,46 @@ class MedicalVectorDB:
             print(f"Error loading database: {e}")
             return False
     
+    def _load_index_file(self):
+        """以内存映射方式加载保存的索引，成功返回True"""
+        index_file = os.path.join(self.data_dir, 'index.faiss')
+        # 近似重复检测需要同时构建余弦索引，此时直接重建
+        if not self.mmap_index or self.near_duplicate_threshold is not None or not os.path.exists(index_file):
+            return False
+        try:
+            flags = getattr(faiss, 'IO_FLAG_MMAP_IFC', faiss.IO_FLAG_MMAP) | faiss.IO_FLAG_READ_ONLY
+            with span("vector_db.load_index", bytes=os.path.getsize(index_file)):
+                index = faiss.read_index(index_file, flags)
+        except Exception as e:
+            print(f"Error loading index file: {e}")
+            return False
+        if index.ntotal != len(self.papers) or index.d != self.embedding_dim:
+            print("Index file is out of date, rebuilding.")
+            return False
+        self.index = index
+        print(f"Memory-mapped index with {index.ntotal} papers.")
+        return True
+    
+    def _use_mmap_index(self):
+        """换用内存映射的索引文件，成功后释放内存中的向量"""
+        if not self._load_index_file():
+            return False
+        for paper in self.papers:
+            paper.pop('embedding', None)
+        return True
+    
     def clear_database(self):
         """清空数据库"""
-        self.papers = []
-        self.index = None
-        
-        # 删除数据文件
-        papers_file = os.path.join(self.data_dir, 'papers.json')
-        if os.path.exists(papers_file):
-            os.remove(papers_file)
+        with self._lock:
+            self.papers = []
+            self.index = None
+            self.cosine_index = None
+            
+            # 删除数据文件
+            for filename in ('papers.json', 'index.faiss'):
+                path = os.path.join(self.data_dir, filename)
+                if os.path.exists(path):
+                    os.remove(path)
         
         print("Database cleared.")
         return True
@@ -244,6 +474,7 @@ class MedicalVectorDB:
         
         return {
             "total_papers": len(self.papers),
+            "near_duplicates": sum(len(p.get('duplicates', [])) for p in self.papers),
             "total_journals": len(journals),
             "total_authors": len(authors_set),
             "top_journals": top_journals,
@@ -0,0 +1,61 @@
+import json
+
+from batch_cli import BatchRunner, completed_ids
+
+
+class FlakyAssistant:
+    def __init__(self, failing=()):
+        self.failing = set(failing)
+
+    def generate_patient_education(self, topic, session_id=None, priority=None):
+        if topic in self.failing:
+            raise RuntimeError("upstream error")
+        return f"material about {topic}"
+
+    def clear_history(self, session_id=None):
+        pass
+
+
+def run(output, items, failing=()):
+    done = completed_ids(output)
+    pending = [item for item in items if item["id"] not in done]
+    runner = BatchRunner(FlakyAssistant(failing), None, "education", output, concurrency=2, batch_size=2)
+    runner.run(pending)
+    return runner
+
+
+def test_retries_are_compacted_to_one_row_per_id(tmp_path):
+    output = str(tmp_path / "out.jsonl")
+    items = [{"id": name, "input": name} for name in ("asthma", "diabetes", "migraine")]
+
+    first = run(output, items, failing={"diabetes"})
+    assert (first.succeeded, first.failed) == (2, 1)
+    run(output, items, failing={"diabetes"})
+    second = run(output, items)
+    assert (second.succeeded, second.failed) == (1, 0)
+
+    with open(output, encoding="utf-8") as f:
+        rows = [json.loads(line) for line in f]
+    assert [row["id"] for row in rows] == ["asthma", "diabetes", "migraine"]
+    assert all(row["error"] is None for row in rows)
+    assert completed_ids(output) == {"asthma", "diabetes", "migraine"}
+
+
+class FailingVectorDB:
+    def search_batch(self, queries, k=5):
+        raise RuntimeError("embedding model unavailable")
+
+
+def test_context_errors_are_written_per_chunk(tmp_path):
+    output = str(tmp_path / "out.jsonl")
+    items = [{"id": str(i), "input": f"question {i}"} for i in range(3)]
+
+    runner = BatchRunner(FlakyAssistant(), FailingVectorDB(), "question", output, batch_size=2, context_k=3)
+    runner.run(items)
+
+    assert (runner.succeeded, runner.failed) == (0, 3)
+    with open(output, encoding="utf-8") as f:
+        rows = [json.loads(line) for line in f]
+    assert [row["id"] for row in rows] == ["0", "1", "2"]
+    assert all("embedding model unavailable" in row["error"] for row in rows)
+    assert completed_ids(output) == set()
@@ -0,0 +1,106 @@
+import threading
+import time
+
+from ingest_queue import IngestionWorker
+
+
+class FakeVectorDB:
+    """记录入库批次的假数据库，gate 未打开时 add_papers 阻塞"""
+
+    def __init__(self, fail=False):
+        self.papers = []
+        self.batches = []
+        self.gate = threading.Event()
+        self.gate.set()
+        self.fail = fail
+
+    def add_papers(self, papers):
+        self.gate.wait(5)
+        if self.fail:
+            raise RuntimeError("disk full")
+        self.batches.append(papers)
+        known = {q["pmid"] for q in self.papers}
+        new = []
+        for paper in papers:
+            if paper["pmid"] not in known:
+                known.add(paper["pmid"])
+                new.append(paper)
+        self.papers.extend(new)
+        # 模拟其他写入者同时加入的论文，不应计入入库进度
+        self.papers.append({"pmid": f"other-{len(self.batches)}"})
+        return len(new)
+
+
+def papers(*pmids):
+    return [{"pmid": pmid} for pmid in pmids]
+
+
+def test_full_queue_returns_false_after_timeout():
+    db = FakeVectorDB()
+    db.gate.clear()
+    worker = IngestionWorker(db, max_queue_size=1).start()
+    try:
+        assert worker.submit(papers("1"))
+        # 等后台线程取走第一批并阻塞在 add_papers 中
+        deadline = time.monotonic() + 5
+        while worker.get_status()["in_progress_papers"] == 0:
+            assert time.monotonic() < deadline
+            time.sleep(0.01)
+        assert worker.submit(papers("2"))
+        assert worker.submit(papers("3"), timeout=0.1) is False
+        assert worker.get_status()["submitted_papers"] == 2
+    finally:
+        db.gate.set()
+        worker.stop(timeout=5)
+
+
+def test_counters_use_add_papers_result():
+    db = FakeVectorDB()
+    worker = IngestionWorker(db).start()
+    try:
+        worker.submit(papers("1", "2"))
+        worker.submit(papers("2", "3"))
+        assert worker.wait_idle(timeout=5)
+        status = worker.get_status()
+        assert status["submitted_papers"] == status["processed_papers"] == 4
+        assert status["added_papers"] == 3
+        assert status["pending_papers"] == 0
+        assert status["failed_batches"] == 0
+    finally:
+        worker.stop(timeout=5)
+
+
+def test_failed_batches_are_counted():
+    worker = IngestionWorker(FakeVectorDB(fail=True)).start()
+    try:
+        worker.submit(papers("1"))
+        assert worker.wait_idle(timeout=5)
+        status = worker.get_status()
+        assert status["failed_batches"] == 1
+        assert status["added_papers"] == 0
+        assert status["last_error"] == "disk full"
+    finally:
+        worker.stop(timeout=5)
+
+
+def test_stop_drains_queued_batches():
+    db = FakeVectorDB()
+    worker = IngestionWorker(db, max_queue_size=5, max_batch_papers=1)
+    for pmid in ("1", "2", "3"):
+        assert worker.submit(papers(pmid))
+    worker.start()
+    worker.stop(timeout=5)
+    assert worker.get_status()["processed_papers"] == 3
+    assert [p["pmid"] for p in db.papers if not p["pmid"].startswith("other")] == ["1", "2", "3"]
+
+
+def test_wait_idle_times_out_while_busy():
+    db = FakeVectorDB()
+    db.gate.clear()
+    worker = IngestionWorker(db).start()
+    try:
+        worker.submit(papers("1"))
+        assert worker.wait_idle(timeout=0.1) is False
+    finally:
+        db.gate.set()
+        worker.stop(timeout=5)
@@ -0,0 +1,101 @@
+from synthetic_corpus import HashingEmbedder, generate_records, inject_near_duplicates
+from vector_db import MedicalVectorDB
+
+DIM = 512
+THRESHOLD = 0.95
+
+
+def make_db(tmp_path):
+    return MedicalVectorDB(data_dir=str(tmp_path), embedding_model=HashingEmbedder(dim=DIM),
+                           embedding_dim=DIM, near_duplicate_threshold=THRESHOLD)
+
+
+def corpus(count=80, rate=0.3):
+    """返回 (原始记录, 混入重复后的记录, {重复PMID: 原始PMID})"""
+    originals = list(generate_records(count))
+    mixed = inject_near_duplicates([dict(r) for r in originals], rate=rate)
+    clusters = {}
+    canonical = None
+    for record in mixed:
+        if int(record["pmid"]) < 80000000:
+            canonical = record["pmid"]
+        else:
+            clusters[record["pmid"]] = canonical
+    return originals, mixed, clusters
+
+
+def duplicates_of(db):
+    return {d["pmid"]: paper["pmid"] for paper in db.papers for d in paper.get("duplicates", [])}
+
+
+def test_duplicates_within_batch_are_indexed_once(tmp_path):
+    originals, mixed, clusters = corpus()
+    db = make_db(tmp_path)
+
+    assert db.add_papers([dict(r) for r in mixed]) == len(mixed)
+
+    assert clusters
+    assert sorted(p["pmid"] for p in db.papers) == sorted(r["pmid"] for r in originals)
+    assert db.index.ntotal == db.cosine_index.ntotal == len(originals)
+    assert duplicates_of(db) == clusters
+    assert db.known_pmids() == {r["pmid"] for r in mixed}
+    assert db.get_statistics()["near_duplicates"] == len(clusters)
+
+
+def test_duplicates_of_existing_papers_are_merged(tmp_path):
+    originals, mixed, clusters = corpus()
+    db = make_db(tmp_path)
+    db.add_papers([dict(r) for r in originals])
+
+    db.add_papers([dict(r) for r in mixed if r["pmid"] in clusters])
+
+    assert len(db.papers) == db.index.ntotal == len(originals)
+    assert duplicates_of(db) == clusters
+
+
+def test_chained_duplicates_attach_to_first_record(tmp_path):
+    record = next(generate_records(1))
+    first = inject_near_duplicates([dict(record)], rate=1.0)[1]
+    second = inject_near_duplicates([dict(first)], rate=1.0, seed=8, start_pmid=90000000)[1]
+    db = make_db(tmp_path)
+
+    db.add_papers([dict(record), dict(first), dict(second)])
+
+    assert [p["pmid"] for p in db.papers] == [record["pmid"]]
+    assert duplicates_of(db) == {first["pmid"]: record["pmid"], second["pmid"]: record["pmid"]}
+
+
+def test_search_returns_one_hit_per_cluster(tmp_path):
+    originals, mixed, clusters = corpus()
+    db = make_db(tmp_path)
+    db.add_papers([dict(r) for r in mixed])
+
+    for original_pmid in list(dict.fromkeys(clusters.values()))[:10]:
+        record = next(r for r in originals if r["pmid"] == original_pmid)
+        query = f"{record['title']} {record['abstract']}"
+        pmids = [p["pmid"] for p in db.search(query, k=10)]
+        assert pmids[0] == original_pmid
+        assert len(pmids) == len(set(pmids))
+        assert not set(pmids) & set(clusters)
+
+
+def test_readding_merged_pmid_is_noop(tmp_path):
+    _, mixed, clusters = corpus()
+    db = make_db(tmp_path)
+    db.add_papers([dict(r) for r in mixed])
+    before = (len(db.papers), len(duplicates_of(db)))
+
+    duplicate = next(r for r in mixed if r["pmid"] in clusters)
+    assert db.add_papers([dict(duplicate)]) == 0
+    assert (len(db.papers), len(duplicates_of(db))) == before
+
+
+def test_reload_rebuilds_cosine_index(tmp_path):
+    originals, mixed, clusters = corpus()
+    make_db(tmp_path).add_papers([dict(r) for r in originals])
+
+    db = make_db(tmp_path)
+    assert db.cosine_index.ntotal == len(originals)
+    db.add_papers([dict(r) for r in mixed if r["pmid"] in clusters])
+    assert len(db.papers) == len(originals)
+    assert duplicates_of(db) == clusters
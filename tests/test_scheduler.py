@@ -0,0 +1,84 @@
+import threading
+import time
+
+from gemini_ai import PRIORITY_BATCH, PRIORITY_INTERACTIVE, RequestScheduler
+
+
+def wait_until(predicate, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        if time.monotonic() > deadline:
+            raise AssertionError("condition not reached")
+        time.sleep(0.005)
+
+
+def test_identical_concurrent_requests_are_coalesced():
+    scheduler = RequestScheduler(max_concurrency=4, requests_per_minute=0)
+    calls = []
+    release = threading.Event()
+
+    def upstream():
+        calls.append(1)
+        release.wait(5)
+        return "answer"
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(scheduler.submit("same", upstream)))
+               for _ in range(10)]
+    for t in threads:
+        t.start()
+    wait_until(lambda: len(calls) == 1)
+    time.sleep(0.05)
+    release.set()
+    for t in threads:
+        t.join(5)
+
+    assert len(calls) == 1
+    assert results == ["answer"] * 10
+    assert scheduler.get_status()["inflight"] == 0
+
+
+def test_interactive_requests_run_before_batch():
+    scheduler = RequestScheduler(max_concurrency=1, requests_per_minute=0)
+    release = threading.Event()
+    order = []
+
+    blocker = threading.Thread(target=scheduler.submit, args=(None, lambda: release.wait(5)))
+    blocker.start()
+    wait_until(lambda: scheduler.get_status()["active"] == 1)
+
+    batch = threading.Thread(target=scheduler.submit,
+                             args=(None, lambda: order.append("batch"), PRIORITY_BATCH))
+    batch.start()
+    wait_until(lambda: scheduler.get_status()["waiting"] == 1)
+    interactive = threading.Thread(target=scheduler.submit,
+                                   args=(None, lambda: order.append("interactive"), PRIORITY_INTERACTIVE))
+    interactive.start()
+    wait_until(lambda: scheduler.get_status()["waiting"] == 2)
+
+    release.set()
+    for t in (blocker, batch, interactive):
+        t.join(5)
+    assert order == ["interactive", "batch"]
+
+
+def test_rate_budget_blocks_until_window_expires():
+    clock = [1000.0]
+    scheduler = RequestScheduler(max_concurrency=10, requests_per_minute=3, clock=lambda: clock[0])
+
+    for i in range(3):
+        assert scheduler.submit(None, lambda i=i: i) == i
+
+    done = threading.Event()
+    extra = threading.Thread(target=lambda: (scheduler.submit(None, lambda: None), done.set()))
+    extra.start()
+    wait_until(lambda: scheduler.get_status()["waiting"] == 1)
+    assert not done.wait(0.2)
+    assert scheduler.get_status()["requests_last_minute"] == 3
+
+    # 一分钟后最早的配额释放
+    clock[0] += 61
+    with scheduler._cond:
+        scheduler._cond.notify_all()
+    assert done.wait(5)
+    extra.join(5)
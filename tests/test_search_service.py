@@ -0,0 +1,122 @@
+import asyncio
+import socket
+import threading
+import time
+
+import pytest
+import requests
+
+from search_client import SearchServiceClient
+from search_service import SearchService
+from synthetic_corpus import HashingEmbedder, generate_records
+from vector_db import MedicalVectorDB
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@pytest.fixture
+def service(tmp_path):
+    vector_db = MedicalVectorDB(data_dir=str(tmp_path), embedding_model=HashingEmbedder(dim=64),
+                                embedding_dim=64, mmap_index=True)
+    vector_db.add_papers([dict(r) for r in generate_records(50)])
+    service = SearchService(vector_db)
+    port = free_port()
+    loop = asyncio.new_event_loop()
+
+    def run():
+        try:
+            loop.run_until_complete(service.serve("127.0.0.1", port))
+        except asyncio.CancelledError:
+            pass
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + 5
+    while True:
+        try:
+            requests.get(url + "/health", timeout=1)
+            break
+        except requests.ConnectionError:
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(0.05)
+    yield url, vector_db, service
+    loop.call_soon_threadsafe(lambda: [task.cancel() for task in asyncio.all_tasks(loop)])
+    thread.join(5)
+
+
+@pytest.mark.parametrize("path, payload", [
+    ("/search", {"query": "statin", "k": "five"}),
+    ("/search", {"query": "statin", "k": True}),
+    ("/search", {"query": "statin", "k": 0}),
+    ("/filter_search", {"query": "statin", "filters": ["2020"]}),
+    ("/filter_search", {"query": "statin", "filters": {"author": 3}}),
+    ("/search_batch", {"queries": "statin"}),
+    ("/ingest", {"papers": ["12345"]}),
+    ("/ingest", {"papers": [], "wait_s": -1}),
+    ("/ingest", {"papers": [], "wait_s": "30"}),
+])
+def test_invalid_requests_return_400(service, path, payload):
+    url, _, _ = service
+    assert requests.post(url + path, json=payload, timeout=10).status_code == 400
+
+
+@pytest.mark.parametrize("length", ["abc", "-5"])
+def test_invalid_content_length_returns_400(service, length):
+    url, _, _ = service
+    host, port = url.rsplit("/", 1)[1].split(":")
+    with socket.create_connection((host, int(port)), timeout=10) as sock:
+        sock.sendall(f"POST /search HTTP/1.1\r\nHost: {host}\r\n"
+                     f"Content-Length: {length}\r\n\r\n".encode())
+        response = sock.recv(4096).decode()
+    assert response.startswith("HTTP/1.1 400")
+
+
+def test_search_batch_matches_single_searches(service):
+    url, _, _ = service
+    client = SearchServiceClient(url)
+    queries = ["metformin diabetes", "statin therapy", "metformin diabetes"]
+    assert client.search_batch(queries, k=3) == [client.search(q, k=3) for q in queries]
+
+
+def test_client_ingests_synchronously_and_reports_pmids(service):
+    url, vector_db, _ = service
+    client = SearchServiceClient(url)
+    new_papers = list(generate_records(5, start_pmid=40000000))
+
+    assert client.add_papers(new_papers) == 5
+    assert len(vector_db.papers) == 55
+    assert {str(p["pmid"]) for p in new_papers} <= client.known_pmids()
+
+    assert client.submit(list(generate_records(3, start_pmid=41000000)))
+    deadline = time.monotonic() + 10
+    while client.get_status()["added_papers"] < 3:
+        assert time.monotonic() < deadline
+        time.sleep(0.05)
+    assert client.queue_depth() == 0
+
+
+def test_client_submit_passes_queue_wait_to_service(service, capsys):
+    url, _, search_service = service
+    waits = []
+
+    def full_queue_submit(papers, timeout):
+        waits.append(timeout)
+        time.sleep(min(timeout, 1.5))
+        return False
+
+    search_service.ingestion_worker.submit = full_queue_submit
+    # 服务端等待的时间超过客户端默认的HTTP超时，客户端仍应收到503而不是先超时
+    client = SearchServiceClient(url, timeout=1)
+    papers = list(generate_records(2, start_pmid=40000000))
+
+    assert client.submit(papers, timeout=0) is False
+    assert client.submit(papers, timeout=1.5) is False
+    assert client.submit(papers, timeout=120) is False
+    assert waits == [0, 1.5, 30]
+    assert capsys.readouterr().out.count("Search service error 503") == 3
@@ -0,0 +1,168 @@
+from datetime import date
+
+import pytest
+
+import pubmed_api
+from stub_eutils import StubEutils
+import subscriptions as syncer_module
+from subscriptions import SubscriptionStore, SubscriptionSyncer
+from synthetic_corpus import HashingEmbedder, generate_records
+from vector_db import MedicalVectorDB
+
+TODAY = date(2026, 10, 12)
+QUERY = "vaccine"
+
+
+def vaccine_records(count, start_pmid):
+    records = []
+    for i, record in enumerate(generate_records(count, start_pmid=start_pmid)):
+        record["title"] = f"Vaccine trial {i}: {record['title']}"
+        records.append(record)
+    return records
+
+
+@pytest.fixture
+def stub(monkeypatch):
+    stub = StubEutils().start()
+    monkeypatch.setattr(pubmed_api, "EUTILS_BASE_URL", stub.base_url)
+    yield stub
+    stub.stop()
+
+
+@pytest.fixture
+def vector_db(tmp_path):
+    return MedicalVectorDB(data_dir=str(tmp_path / "db"), embedding_model=HashingEmbedder(dim=32),
+                           embedding_dim=32)
+
+
+def make_syncer(tmp_path, vector_db, max_results=100, **kwargs):
+    store = SubscriptionStore(str(tmp_path / "subs"))
+    store.add(QUERY, max_results=max_results, days=30, today=TODAY)
+    return store, SubscriptionSyncer(store, vector_db, page_size=7, request_interval=0,
+                                     **kwargs)
+
+
+def test_sync_all_only_ingests_new_papers(tmp_path, stub, vector_db):
+    stub.add_records(vaccine_records(5, 30000000), edat=date(2026, 10, 1))
+    store, syncer = make_syncer(tmp_path, vector_db)
+
+    assert syncer.sync_all(today=TODAY) == {QUERY: 5}
+    assert syncer.sync_all(today=TODAY) == {QUERY: 0}
+
+    stub.add_records(vaccine_records(3, 31000000), edat=TODAY)
+    assert syncer.sync_all(today=TODAY) == {QUERY: 3}
+    assert len(vector_db.papers) == 8
+    assert store.subscriptions[QUERY]["last_sync"] == "2026/10/12"
+
+
+def test_window_beyond_max_results_is_kept_pending(tmp_path, stub, vector_db):
+    stub.add_records(vaccine_records(30, 30000000), edat=date(2026, 10, 1))
+    store, syncer = make_syncer(tmp_path, vector_db, max_results=10)
+
+    counts = [syncer.sync_all(today=TODAY)[QUERY] for _ in range(4)]
+
+    assert counts == [10, 10, 10, 0]
+    assert len(vector_db.papers) == 30
+    assert store.subscriptions[QUERY]["pending_pmids"] == []
+
+
+def test_esearch_error_keeps_high_water_mark(tmp_path, stub, vector_db):
+    stub.add_records(vaccine_records(5, 30000000), edat=date(2026, 10, 1))
+    store, syncer = make_syncer(tmp_path, vector_db)
+    before = dict(store.subscriptions[QUERY])
+
+    stub.fail_endpoints.add("esearch")
+    assert syncer.sync_all(today=TODAY) == {}
+    subscription = SubscriptionStore(str(tmp_path / "subs")).subscriptions[QUERY]
+    assert subscription["last_sync"] == before["last_sync"]
+    assert subscription["seen_pmids"] == []
+    assert subscription["last_error"]
+    assert vector_db.papers == []
+
+    stub.fail_endpoints.clear()
+    assert syncer.sync_all(today=TODAY) == {QUERY: 5}
+    assert store.subscriptions[QUERY]["last_error"] is None
+
+
+def test_ingest_error_rolls_back_subscription_state(tmp_path, stub, vector_db):
+    stub.add_records(vaccine_records(5, 30000000), edat=date(2026, 10, 1))
+
+    def failing_ingest(papers):
+        raise RuntimeError("disk full")
+
+    store, syncer = make_syncer(tmp_path, vector_db, ingest=failing_ingest)
+    with pytest.raises(RuntimeError):
+        syncer.sync_all(today=TODAY)
+    assert store.subscriptions[QUERY]["last_sync"] == "2026/09/12"
+
+    syncer.ingest = vector_db.add_papers
+    assert syncer.sync_all(today=TODAY) == {QUERY: 5}
+    assert len(vector_db.papers) == 5
+
+
+def test_unfetchable_pmids_do_not_block_later_papers(tmp_path, stub, vector_db):
+    records = vaccine_records(15, 30000000)
+    stub.add_records(records, edat=date(2026, 10, 1))
+    # esearch 按日期、PMID倒序返回，最前面的5篇无法获取
+    stub.fail_pmids.update(r["pmid"] for r in records[-5:])
+    store, syncer = make_syncer(tmp_path, vector_db, max_results=5)
+
+    counts = [syncer.sync_all(today=TODAY)[QUERY] for _ in range(6)]
+
+    assert counts == [0, 5, 5, 0, 0, 0]
+    assert len(vector_db.papers) == 10
+    subscription = store.subscriptions[QUERY]
+    assert subscription["pending_pmids"] == []
+    assert subscription["retry_pmids"] == {}
+    assert sorted(subscription["parked_pmids"]) == sorted(r["pmid"] for r in records[-5:])
+
+
+def test_store_save_during_ingest_does_not_persist_new_high_water_mark(tmp_path, stub, vector_db):
+    stub.add_records(vaccine_records(5, 30000000), edat=date(2026, 10, 1))
+
+    def ingest(papers):
+        # 例如界面上同时添加或取消了其他订阅
+        store.add("influenza", today=TODAY)
+        raise RuntimeError("embedding failed")
+
+    store, syncer = make_syncer(tmp_path, vector_db, ingest=ingest)
+    with pytest.raises(RuntimeError):
+        syncer.sync_all(today=TODAY)
+
+    on_disk = SubscriptionStore(str(tmp_path / "subs")).subscriptions
+    assert on_disk[QUERY]["last_sync"] == "2026/09/12"
+    assert on_disk[QUERY]["seen_pmids"] == []
+    assert "influenza" in on_disk
+
+
+def test_failed_database_save_keeps_high_water_mark(tmp_path, stub, vector_db, monkeypatch):
+    stub.add_records(vaccine_records(5, 30000000), edat=date(2026, 10, 1))
+    store, syncer = make_syncer(tmp_path, vector_db)
+    monkeypatch.setattr(vector_db, "save_database", lambda: False)
+
+    with pytest.raises(OSError):
+        syncer.sync_all(today=TODAY)
+    assert store.subscriptions[QUERY]["last_sync"] == "2026/09/12"
+
+
+def test_ingest_returning_false_keeps_high_water_mark(tmp_path, stub, vector_db):
+    stub.add_records(vaccine_records(5, 30000000), edat=date(2026, 10, 1))
+    store, syncer = make_syncer(tmp_path, vector_db, ingest=lambda papers: False)
+
+    with pytest.raises(RuntimeError):
+        syncer.sync_all(today=TODAY)
+    assert store.subscriptions[QUERY]["last_sync"] == "2026/09/12"
+
+
+def test_window_pages_are_throttled(tmp_path, stub, vector_db, monkeypatch):
+    stub.add_records(vaccine_records(20, 30000000), edat=date(2026, 10, 1))
+    store, syncer = make_syncer(tmp_path, vector_db)
+    syncer.request_interval = 0.34
+    sleeps = []
+    monkeypatch.setattr(syncer_module.time, "sleep", sleeps.append)
+
+    ids = syncer._window_ids(store.subscriptions[QUERY], "2026/10/12")
+
+    assert len(ids) == 20
+    # 20条分3页，第一页之前不等待
+    assert sleeps == [0.34, 0.34]
@@ -0,0 +1,104 @@
+import json
+import time
+from collections import deque
+
+import pytest
+
+import tracing
+from tracing import span
+
+
+@pytest.fixture(autouse=True)
+def fresh_tracing(monkeypatch):
+    monkeypatch.setattr(tracing, "_buffer", deque(maxlen=1000))
+    monkeypatch.setattr(tracing, "_enabled", True)
+
+
+def record(name, duration_ms, error=None):
+    s = tracing.Span(name, {})
+    s.start = time.time()
+    s.duration = duration_ms / 1000
+    s.error = error
+    tracing._buffer.append(s)
+
+
+def test_ring_buffer_keeps_only_latest_spans(monkeypatch):
+    monkeypatch.setattr(tracing, "_buffer", deque(maxlen=3))
+    for i in range(5):
+        with span("stage", i=i):
+            pass
+    assert [s.attrs["i"] for s in tracing.get_spans()] == [2, 3, 4]
+
+
+def test_nested_spans_record_parent_and_attrs():
+    with span("outer") as outer:
+        with span("inner", k=5) as inner:
+            inner.set("hits", 3)
+        with span("inner"):
+            pass
+    assert outer.parent is None
+    assert inner.parent == "outer"
+    assert inner.attrs == {"k": 5, "hits": 3}
+    # span 在结束时写入缓冲区，外层最后完成
+    assert [s.name for s in tracing.get_spans()] == ["inner", "inner", "outer"]
+    assert len(tracing.get_spans("inner")) == 2
+
+
+def test_exception_is_recorded_and_propagated():
+    with pytest.raises(ValueError):
+        with span("failing"):
+            raise ValueError("boom")
+    with span("after"):
+        pass
+    failing, after = tracing.get_spans()
+    assert failing.error == "ValueError"
+    assert failing.duration >= 0
+    # 异常后父子关系栈已恢复
+    assert after.parent is None
+
+
+def test_stage_stats_percentiles():
+    for ms in range(1, 101):
+        record("search", ms)
+    record("embed", 7, error="RuntimeError")
+    record("embed", 3)
+
+    stats = {s["stage"]: s for s in tracing.stage_stats()}
+    assert stats["search"]["count"] == 100
+    assert stats["search"]["p50_ms"] == 50
+    assert stats["search"]["p95_ms"] == 95
+    assert stats["search"]["max_ms"] == 100
+    assert stats["embed"] == {"stage": "embed", "count": 2, "errors": 1,
+                              "p50_ms": 3, "p95_ms": 7, "max_ms": 7}
+
+
+def test_export_jsonl_round_trip(tmp_path):
+    with span("outer", query="statin"):
+        with span("inner", k=3):
+            pass
+    path = tmp_path / "spans.jsonl"
+    assert tracing.export_jsonl(str(path)) == 2
+    rows = [json.loads(line) for line in path.read_text(encoding="utf-8").splitlines()]
+    assert rows == [s.to_dict() for s in tracing.get_spans()]
+    assert rows[0]["parent"] == "outer" and rows[0]["attrs"] == {"k": 3}
+    assert tracing.export_jsonl() == path.read_text(encoding="utf-8")
+
+
+def test_disabled_tracing_uses_shared_noop():
+    tracing.set_enabled(False)
+    first = span("stage", k=1)
+    assert first is span("other") is tracing._NOOP
+    with first as s:
+        s.set("ignored", True)
+    assert tracing.get_spans() == []
+    assert tracing.stage_stats() == []
+
+
+def test_disabled_tracing_overhead_is_negligible():
+    tracing.set_enabled(False)
+    start = time.perf_counter()
+    for _ in range(100000):
+        with span("hot.path", k=5) as s:
+            s.set("hits", 1)
+    # 每次不到10微秒（通常远低于1微秒）
+    assert time.perf_counter() - start < 1.0
@@ -0,0 +1,63 @@
+import threading
+
+from synthetic_corpus import HashingEmbedder, generate_records
+from vector_db import MedicalVectorDB
+
+
+def make_db(tmp_path, **kwargs):
+    return MedicalVectorDB(data_dir=str(tmp_path), embedding_model=HashingEmbedder(dim=64),
+                           embedding_dim=64, **kwargs)
+
+
+def test_search_during_ingest_and_clear(tmp_path):
+    db = make_db(tmp_path)
+    records = list(generate_records(200))
+    errors = []
+    stop = threading.Event()
+
+    def searcher():
+        while not stop.is_set():
+            try:
+                for results in db.search_batch(["metformin diabetes", "statin therapy"], k=5):
+                    assert len(results) <= 5
+            except Exception as e:
+                errors.append(e)
+                return
+
+    threads = [threading.Thread(target=searcher) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for _ in range(3):
+        for offset in range(0, len(records), 20):
+            db.add_papers([dict(r) for r in records[offset:offset + 20]])
+        db.clear_database()
+    stop.set()
+    for t in threads:
+        t.join(5)
+
+    assert errors == []
+
+
+def test_mmap_mode_keeps_vectors_only_in_index_file(tmp_path):
+    records = list(generate_records(60))
+    make_db(tmp_path, mmap_index=True).add_papers([dict(r) for r in records[:40]])
+
+    db = make_db(tmp_path, mmap_index=True)
+    assert db.index.ntotal == 40
+    assert all('embedding' not in paper for paper in db.papers)
+
+    db.add_papers([dict(r) for r in records[40:]])
+    assert db.index.ntotal == 60
+    assert all('embedding' not in paper for paper in db.papers)
+
+    # papers.json 仍包含完整向量，不使用内存映射也能重建索引
+    plain = make_db(tmp_path)
+    assert plain.index.ntotal == 60
+    assert all(len(paper['embedding']) == 64 for paper in plain.papers)
+    assert [p['pmid'] for p in plain.search("statin therapy", k=5)] == \
+           [p['pmid'] for p in db.search("statin therapy", k=5)]
+
+
+def test_index_file_only_written_in_mmap_mode(tmp_path):
+    make_db(tmp_path).add_papers([dict(r) for r in generate_records(5)])
+    assert not (tmp_path / "index.faiss").exists()